@@ -3,7 +3,6 @@ CSS Generator for RetrOS - Era-specific styling using template-based approach.
 This avoids heavy LLM overhead while providing era-appropriate CSS.
 """
 import logging
-import re
 import hashlib
 
 logger = logging.getLogger(__name__)
@@ -41,53 +40,42 @@ class CSSGenerationError(Exception):
     pass
 
 
-def _generate_era_css(era: str, dom_info: dict) -> str:
-    """Generate CSS based on era template and DOM info."""
-    if era not in ERA_TEMPLATES:
-        raise CSSGenerationError(f"Unknown era: {era}")
-    
+# Border effects per era, expanded once since ERA_TEMPLATES is static
+_BORDER_RULES = {
+    era: "".join(
+        f"div, section {{ {effect}; }}\n"
+        for effect in template["effects"]
+        if "border" in effect.lower()
+    )
+    for era, template in ERA_TEMPLATES.items()
+}
+
+
+def _build_era_css(era: str) -> str:
+    """Build CSS for an era template (depends only on the era)."""
     template = ERA_TEMPLATES[era]
-    logger.info(f"Generating {era} CSS")
-    
-    # Build CSS rules for common elements
-    css_lines = [
-        f"/* RetrOS - {era} Era Styling */",
-        f"/* Generated for era: {era} */",
-        "",
-        "* { font-family: " + template["fonts"] + "; }",
-        "",
-    ]
     
     # Color palette (rotate through colors for different elements)
     colors = template["colors"]
     effects = template["effects"]
+    button_effect = effects[0] if effects else ""
+    
+    css_text = (
+        f"/* RetrOS - {era} Era Styling */\n"
+        f"/* Generated for era: {era} */\n"
+        "\n"
+        f"* {{ font-family: {template['fonts']}; }}\n"
+        "\n"
+        f"body {{ background-color: {colors[0]}; color: {colors[2]}; }}\n"
+        f"div, section, article, main {{ background-color: {colors[1]}; padding: 8px; margin: 4px; }}\n"
+        f"h1, h2, h3 {{ color: {colors[2]}; font-weight: bold; }}\n"
+        f"p, span, a {{ color: {colors[2]}; }}\n"
+        "a { text-decoration: underline; }\n"
+        f"button, input[type='button'], input[type='submit'] {{ background-color: {colors[0]}; color: {colors[3]}; padding: 4px 8px; {button_effect}; }}\n"
+        f"input, textarea {{ background-color: {colors[3]}; border: 1px solid {colors[2]}; padding: 4px; }}\n"
+        f"{_BORDER_RULES[era]}"
+    )
     
-    # Style body
-    css_lines.append(f"body {{ background-color: {colors[0]}; color: {colors[2]}; }}")
-    
-    # Style common containers
-    css_lines.append(f"div, section, article, main {{ background-color: {colors[1]}; padding: 8px; margin: 4px; }}")
-    
-    # Style text elements
-    css_lines.append(f"h1, h2, h3 {{ color: {colors[2]}; font-weight: bold; }}")
-    css_lines.append(f"p, span, a {{ color: {colors[2]}; }}")
-    css_lines.append(f"a {{ text-decoration: underline; }}")
-    
-    # Style buttons/interactive
-    css_lines.append(f"button, input[type='button'], input[type='submit'] {{ background-color: {colors[0]}; color: {colors[3]}; padding: 4px 8px; {effects[0] if len(effects) > 0 else ''}; }}")
-    
-    # Style inputs
-    css_lines.append(f"input, textarea {{ background-color: {colors[3]}; border: 1px solid {colors[2]}; padding: 4px; }}")
-    
-    # Add era-specific effects
-    for effect in effects:
-        if "border" in effect.lower():
-            css_lines.append(f"div, section {{ {effect}; }}")
-    
-    css_lines.append("")
-    css_text = "\n".join(css_lines)
-    
-    logger.debug(f"Generated CSS ({len(css_text)} bytes)")
     return css_text
 
 
@@ -102,18 +90,32 @@ def _validate_css(css: str) -> tuple[bool, str]:
         errors.append(f"Mismatched braces: {open_braces} open, {close_braces} close")
     
     # Basic check: should have some content
-    if not css.strip() or len(css.strip()) < 10:
+    if len(css.strip()) < 10:
         errors.append("CSS appears to be empty or too short")
     
     if errors:
         msg = "; ".join(errors)
-        logger.warning(f"CSS validation issues: {msg}")
+        logger.warning("CSS validation issues: %s", msg)
         return False, msg
     
     logger.info("CSS validation passed")
     return True, ""
 
 
+# Era CSS is fully determined by the static templates, so build and
+# validate it once at import; the request path is a dict lookup.
+_ERA_CSS_CACHE: dict[str, str] = {era: _build_era_css(era) for era in ERA_TEMPLATES}
+_ERA_CSS_BYTES: dict[str, int] = {era: len(css.encode("utf-8")) for era, css in _ERA_CSS_CACHE.items()}
+_ERA_VALIDATION: dict[str, tuple[bool, str]] = {
+    era: _validate_css(css) for era, css in _ERA_CSS_CACHE.items()
+}
+# Hasher state with the constant "<era>|" prefix already absorbed.
+# Cache keys only need collision resistance, so BLAKE2b (128-bit) is used.
+_ERA_HASH_PREFIX = {
+    era: hashlib.blake2b(f"{era}|".encode(), digest_size=16) for era in ERA_TEMPLATES
+}
+
+
 def generate_css(dom_content: str, era: str, dom_digest: str = "", feedback: dict = None) -> dict:
     """
     Generate era-appropriate CSS from DOM content.
@@ -128,24 +130,25 @@ def generate_css(dom_content: str, era: str, dom_digest: str = "", feedback: dic
         dict with css, metadata, cache_key
     """
     try:
-        logger.info(f"Generating CSS for era={era}, digest={dom_digest[:16] if dom_digest else 'N/A'}...")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Generating CSS for era=%s, digest=%s...", era, dom_digest[:16] if dom_digest else 'N/A')
         
         # Parse feedback if provided
         feedback_type = feedback.get("type", "") if feedback else ""
         
-        # Extract basic DOM info (simplified for now)
-        dom_info = {
-            "tag_count": len(re.findall(r"<[a-z]+", dom_content.lower())) if isinstance(dom_content, str) else 0,
-        }
-        
-        # Generate CSS based on era
-        css = _generate_era_css(era, dom_info)
+        # Look up prebuilt CSS for the era
+        css = _ERA_CSS_CACHE.get(era)
+        if css is None:
+            raise CSSGenerationError(f"Unknown era: {era}")
+        logger.info("Generating %s CSS", era)
         
-        # Validate CSS
-        valid, validation_msg = _validate_css(css)
+        # Validation result is precomputed per era
+        valid, validation_msg = _ERA_VALIDATION[era]
         
         # Compute cache key
-        cache_key = hashlib.sha256(f"{era}|{dom_digest}".encode()).hexdigest()
+        hasher = _ERA_HASH_PREFIX[era].copy()
+        hasher.update(dom_digest.encode())
+        cache_key = hasher.hexdigest()
         
         result = {
             "status": "ok",
@@ -157,12 +160,12 @@ def generate_css(dom_content: str, era: str, dom_digest: str = "", feedback: dic
             "feedback_applied": bool(feedback_type),
         }
         
-        logger.info(f"CSS generation complete: {len(css)} bytes, valid={valid}")
+        logger.info("CSS generation complete: %d bytes, valid=%s", _ERA_CSS_BYTES[era], valid)
         return result
         
     except CSSGenerationError as e:
-        logger.error(f"CSS generation error: {e}")
+        logger.error("CSS generation error: %s", e)
         raise
     except Exception as e:
-        logger.error(f"Unexpected error in CSS generation: {e}")
+        logger.error("Unexpected error in CSS generation: %s", e)
         raise CSSGenerationError(str(e))
@@ -1,10 +1,12 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+import json
 import logging
+import string
 import time
-import re
 import fetcher
 import ai_generator
 from css_generator_llm import generate_css_with_llm, get_ai_status
@@ -12,7 +14,8 @@ from cache_storage import (
     get_cached_style,
     save_cached_style,
     build_cache_key,
-    get_total_cache_size_bytes
+    get_cache_size_bytes,
+    recompute_cache_size_bytes
 )
 
 # Configure logging with detailed format
@@ -22,7 +25,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Try importing orjson for faster request/response JSON; fall back to stdlib
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, honoring Flask's sort_keys/indent options."""
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+if ORJSON_AVAILABLE:
+    app.json = OrjsonProvider(app)
 CORS(app)
 
 # Initialize rate limiter
@@ -34,10 +62,29 @@ limiter = Limiter(
 
 # Valid eras for validation
 VALID_ERAS = ["web1996", "win95", "win98", "winxp"]
+_VALID_ERAS_SET = frozenset(VALID_ERAS)
+_VALID_ERAS_MSG = f"era must be one of: {', '.join(VALID_ERAS)}"
+_MAX_HTML_BYTES = 10 * 1024 * 1024  # 10MB
+
+# Characters allowed in a domain; checked in O(n) without a regex
+_DOMAIN_ALLOWED = frozenset(string.ascii_letters + string.digits + ".-")
+
+
+def _valid_domain(domain: str) -> bool:
+    """Domain is made only of allowed characters and has a dot with text on both sides."""
+    return "." in domain[1:-1] and _DOMAIN_ALLOWED.issuperset(domain)
+
+
+# Admin routes are only served to clients on this machine
+_LOOPBACK_ADDRS = frozenset({"127.0.0.1", "::1"})
+
+
+# Static response bodies, serialized once at import
+_HEALTH_BODY = json.dumps({"status": "ok"}).encode("utf-8")
 
 @app.route("/health", methods=["GET"])
 def health():
-    return jsonify({"status": "ok"}), 200
+    return Response(_HEALTH_BODY, status=200, mimetype="application/json")
 
 def _validate_request_data(data):
     """
@@ -54,15 +101,18 @@ def _validate_request_data(data):
         errors.append("domain is required")
     elif len(domain) > 255:
         errors.append("domain exceeds maximum length (255 characters)")
-    elif not re.match(r"^[a-zA-Z0-9\-\.]+\.[a-zA-Z0-9\-\.]+", domain):
+    elif not _valid_domain(domain):
         errors.append("domain format is invalid")
     else:
         sanitized["domain"] = domain
     
     # Validate era (optional, defaults to win95)
-    era = data.get("era", "win95").strip().lower()
-    if era not in VALID_ERAS:
-        errors.append(f"era must be one of: {', '.join(VALID_ERAS)}")
+    era = data.get("era", "win95")
+    if era not in _VALID_ERAS_SET:
+        # Only normalize when the client didn't send a canonical value
+        era = era.strip().lower()
+    if era not in _VALID_ERAS_SET:
+        errors.append(_VALID_ERAS_MSG)
     else:
         sanitized["era"] = era
     
@@ -89,7 +139,7 @@ def _validate_request_data(data):
     
     # HTML is optional
     html_content = data.get("html", "").strip()
-    if html_content and len(html_content) > 10 * 1024 * 1024:  # 10MB max
+    if html_content and len(html_content) > _MAX_HTML_BYTES:
         errors.append("html exceeds maximum size (10MB)")
     else:
         sanitized["html"] = html_content
@@ -135,7 +185,7 @@ def generate_style():
     try:
         data = request.get_json(silent=True) or {}
     except Exception as e:
-        logger.error(f"Invalid JSON in request: {e}")
+        logger.error("Invalid JSON in request: %s", e)
         return jsonify({
             "status": "error",
             "error": "invalid_json",
@@ -145,7 +195,7 @@ def generate_style():
     # Validate request data
     is_valid, validation_errors, sanitized = _validate_request_data(data)
     if not is_valid:
-        logger.warning(f"Request validation failed: {validation_errors}")
+        logger.warning("Request validation failed: %s", validation_errors)
         return jsonify({
             "status": "error",
             "error": "validation_failed",
@@ -161,9 +211,11 @@ def generate_style():
     feedback = sanitized.get("feedback")
     html_content = sanitized.get("html", "")
     
-    logger.info(f"Generating style: domain={domain}, era={era}, dom_digest={dom_digest[:16] if dom_digest else 'none'}")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Generating style: domain=%s, era=%s, dom_digest=%s", domain, era, dom_digest[:16] if dom_digest else 'none')
 
-    if dom_digest:
+    # Serve from the disk cache unless feedback asks for a regeneration
+    if dom_digest and not feedback:
         cached = get_cached_style(domain, era, dom_digest)
         if cached:
             metadata = cached.get("metadata", {})
@@ -171,7 +223,7 @@ def generate_style():
                 "domain": domain,
                 "era": era,
                 "cache_hit": True,
-                "cache_size_bytes": get_total_cache_size_bytes()
+                "cache_size_bytes": get_cache_size_bytes()
             })
             response = {
                 "status": "ok",
@@ -186,7 +238,7 @@ def generate_style():
         url = f"https://{domain}" if domain and not domain.startswith("http") else domain
         if url and url.startswith("http"):
             try:
-                logger.debug(f"Fetching page from {url}")
+                logger.debug("Fetching page from %s", url)
                 fetch_result = fetcher.fetch_page(url)
                 if fetch_result.get("status") == "ok":
                     # For now, we don't have the actual HTML from fetcher
@@ -194,14 +246,14 @@ def generate_style():
                     logger.debug("HTML not returned from fetcher, using template")
                     html_content = f"<html><body><h1>{domain}</h1></body></html>"
             except Exception as e:
-                logger.warning(f"Could not fetch page {url}: {e}")
+                logger.warning("Could not fetch page %s: %s", url, e)
                 html_content = f"<html><body><h1>{domain}</h1></body></html>"
         else:
             html_content = f"<html><body><h1>Sample Page</h1></body></html>"
     
     try:
         # Use LLM pipeline
-        logger.debug(f"Starting CSS generation for {domain}")
+        logger.debug("Starting CSS generation for %s", domain)
         result = generate_css_with_llm(html_content, era, dom_digest, feedback, domain)
         
         # Add timing info
@@ -209,30 +261,32 @@ def generate_style():
         if "metadata" not in result:
             result["metadata"] = {}
         result["metadata"]["generation_ms"] = generation_ms
-        result["metadata"]["cache_hit"] = False
+        result["metadata"].setdefault("cache_hit", False)
         
-        computed_digest = result.get("metadata", {}).get("dom_digest") or result.get("cache_key") or dom_digest
+        # Prefer the client digest so the next lookup with it can hit
+        computed_digest = dom_digest or result.get("metadata", {}).get("dom_digest") or result.get("cache_key")
 
         # Generate cache key
         cache_key = build_cache_key(domain, era, computed_digest)
         result["cacheKey"] = cache_key
 
-        if result.get("css") and result["status"] in ["ok", "fallback"]:
+        # Results served from the result or response cache were persisted when first generated
+        if result.get("css") and result["status"] in ["ok", "fallback"] and not result["metadata"]["cache_hit"]:
             metadata = save_cached_style(domain, era, result["css"], computed_digest)
             result["metadata"]["cache_saved"] = True
             result["metadata"]["cache_timestamp"] = metadata.get("timestamp")
-            result["metadata"]["cache_size_bytes"] = get_total_cache_size_bytes()
+            result["metadata"]["cache_size_bytes"] = get_cache_size_bytes()
         
         if result["status"] in ["ok", "fallback"]:
-            logger.info(f"CSS generation successful for {domain}: {generation_ms}ms (status={result['status']})")
+            logger.info("CSS generation successful for %s: %dms (status=%s)", domain, generation_ms, result['status'])
             return jsonify(result), 200
         else:
             # Error case
-            logger.error(f"CSS generation error for {domain}: {result.get('message', 'Unknown error')}")
+            logger.error("CSS generation error for %s: %s", domain, result.get('message', 'Unknown error'))
             return jsonify(result), 500
     
     except Exception as e:
-        logger.exception(f"CSS generation failed for {domain}: {e}")
+        logger.exception("CSS generation failed for %s: %s", domain, e)
         generation_ms = int((time.time() - request_start_time) * 1000)
         return jsonify({
             "status": "error",
@@ -280,7 +334,7 @@ def fetch_page_endpoint():
     try:
         data = request.get_json(silent=True) or {}
     except Exception as e:
-        logger.error(f"Invalid JSON in fetch-page request: {e}")
+        logger.error("Invalid JSON in fetch-page request: %s", e)
         return jsonify({"error": "invalid_json", "message": "Request body must be valid JSON"}), 400
     
     url = data.get("url", "").strip()
@@ -293,7 +347,7 @@ def fetch_page_endpoint():
         }), 400
     
     if len(url) > 2048:
-        logger.warning(f"fetch-page request URL too long: {len(url)}")
+        logger.warning("fetch-page request URL too long: %d", len(url))
         return jsonify({
             "status": "error",
             "error": "url_too_long",
@@ -301,11 +355,11 @@ def fetch_page_endpoint():
         }), 400
     
     try:
-        logger.info(f"Fetching page: {url}")
+        logger.info("Fetching page: %s", url)
         result = fetcher.fetch_page(url)
         return jsonify(result), 200
     except fetcher.FetchError as e:
-        logger.error(f"Fetch error for {url}: {e}")
+        logger.error("Fetch error for %s: %s", url, e)
         return jsonify({
             "status": "error",
             "error": "fetch_failed",
@@ -313,7 +367,7 @@ def fetch_page_endpoint():
             "url": url
         }), 502
     except Exception as e:
-        logger.exception(f"Unexpected error fetching {url}: {e}")
+        logger.exception("Unexpected error fetching %s: %s", url, e)
         return jsonify({
             "status": "error",
             "error": "internal_error",
@@ -321,6 +375,39 @@ def fetch_page_endpoint():
         }), 500
 
 
+@app.route("/admin/recompute-stats", methods=["POST"])
+@limiter.limit("5/minute")
+def recompute_stats():
+    """
+    Rescan the style cache on disk and reset the running size total.
+    Only accepted from loopback, since it walks the whole cache tree.
+    
+    Response:
+    {
+        "status": "ok",
+        "total_size_bytes": 12345
+    }
+    """
+    if request.remote_addr not in _LOOPBACK_ADDRS:
+        logger.warning("Rejected recompute-stats from %s", request.remote_addr)
+        return jsonify({
+            "status": "error",
+            "error": "forbidden",
+            "message": "Admin endpoints are only available from localhost"
+        }), 403
+    
+    try:
+        total = recompute_cache_size_bytes()
+        return jsonify({"status": "ok", "total_size_bytes": total}), 200
+    except Exception as e:
+        logger.exception("Failed to recompute cache stats: %s", e)
+        return jsonify({
+            "status": "error",
+            "error": "recompute_failed",
+            "message": "Could not recompute cache statistics"
+        }), 500
+
+
 @app.route("/api/feedback-stats", methods=["GET"])
 def feedback_stats():
     """
@@ -340,7 +427,7 @@ def feedback_stats():
         stats = get_feedback_stats()
         return jsonify(stats), 200
     except Exception as e:
-        logger.exception(f"Failed to get feedback stats: {e}")
+        logger.exception("Failed to get feedback stats: %s", e)
         return jsonify({
             "status": "error",
             "error": "stats_failed",
@@ -387,7 +474,7 @@ def feedback_history():
             "feedback": feedback
         }), 200
     except Exception as e:
-        logger.exception(f"Failed to get feedback history: {e}")
+        logger.exception("Failed to get feedback history: %s", e)
         return jsonify({
             "status": "error",
             "error": "history_failed",
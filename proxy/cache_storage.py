@@ -2,21 +2,92 @@
 Hybrid cache storage for generated CSS.
 
 Directory structure:
-~/.retroweb/styles/<era>/<domain>-approved.css
-~/.retroweb/styles/<era>/<domain>-metadata.json
+~/.retroweb/styles/<era>/<domain>.json   {"css": "...", "metadata": {...}}
+
+Each record is written to a temp file and renamed into place, so CSS and
+metadata are always replaced together. Entries from the older two-file layout
+(<domain>-approved.css + <domain>-metadata.json) are converted once, the
+first time the stats are loaded.
 """
 
 from __future__ import annotations
 
+import atexit
+import contextlib
 import json
-import re
+import os
+import string
+import tempfile
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Dict, Optional, Tuple, Any
 
+# Try importing orjson for faster (de)serialization; fall back to stdlib json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 BASE_CACHE_DIR = Path.home() / ".retroweb" / "styles"
 STATS_FILE = BASE_CACHE_DIR / "cache_stats.json"
 
+# Stats are kept in memory and flushed to STATS_FILE every N updates
+STATS_FLUSH_EVERY = 50
+_stats: Optional[Dict[str, Any]] = None
+_stats_dirty = 0
+_stats_lock = threading.Lock()
+
+# Per-process LRU of loaded (domain, era) entries, kept current by save_cached_style
+STYLE_MEMO_MAX = 512
+_style_memo: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+_style_memo_lock = threading.Lock()
+
+
+# Linux-only flag: skip the atime inode update on cache reads
+_O_NOATIME = getattr(os, "O_NOATIME", 0)
+
+
+# Second-resolution timestamp, formatted once per second
+_last_ts_sec = 0
+_last_ts_str = ""
+
+
+def _iso_now() -> str:
+    global _last_ts_sec, _last_ts_str
+    now = int(time.time())
+    if now != _last_ts_sec:
+        _last_ts_str = datetime.fromtimestamp(now, timezone.utc).isoformat()
+        _last_ts_sec = now
+    return _last_ts_str
+
+
+def _read_bytes(path: Path) -> bytes:
+    if not _O_NOATIME:
+        return path.read_bytes()
+    try:
+        fd = os.open(path, os.O_RDONLY | _O_NOATIME)
+    except PermissionError:
+        # O_NOATIME is only allowed on files the process owns
+        fd = os.open(path, os.O_RDONLY)
+    with os.fdopen(fd, "rb") as handle:
+        return handle.read()
+
+
+def _json_dumps(obj: Any) -> bytes:
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
+
+def _json_loads(data: bytes) -> Any:
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
 
 def _ensure_era_dir(era: str) -> Path:
     era_dir = BASE_CACHE_DIR / era
@@ -24,22 +95,92 @@ def _ensure_era_dir(era: str) -> Path:
     return era_dir
 
 
+class _SanitizeTable(dict):
+    """str.translate table: allowed characters map to themselves, anything else to '_'."""
+
+    def __missing__(self, codepoint: int) -> str:
+        return "_"
+
+
+_SANITIZE_TABLE = _SanitizeTable(
+    (ord(ch), ord(ch)) for ch in string.ascii_letters + string.digits + ".-"
+)
+
+
 def _sanitize_domain(domain: str) -> str:
-    return re.sub(r"[^a-zA-Z0-9\.-]", "_", domain)
+    return domain.translate(_SANITIZE_TABLE)
 
 
-def _get_cache_paths(domain: str, era: str) -> Tuple[Path, Path]:
+def _get_record_path(domain: str, era: str) -> Path:
     era_dir = _ensure_era_dir(era)
     safe_domain = _sanitize_domain(domain)
-    css_path = era_dir / f"{safe_domain}-approved.css"
-    meta_path = era_dir / f"{safe_domain}-metadata.json"
-    return css_path, meta_path
+    return era_dir / f"{safe_domain}.json"
+
+
+# mkstemp creates files as 0600; records get the usual 0644 instead (a fixed
+# mode, since reading the umask means briefly changing it for the process)
+_FILE_MODE = 0o644
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(data)
+        os.chmod(tmp_name, _FILE_MODE)
+        os.replace(tmp_name, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_name)
+        raise
+
+
+# Old layout, folded into single records by _migrate_legacy_entries()
+_LEGACY_CSS_SUFFIX = "-approved.css"
+_LEGACY_META_SUFFIX = "-metadata.json"
+# Stored in the stats once the cache tree is in the current layout
+CACHE_LAYOUT_VERSION = 2
+
+
+def _migrate_legacy_entries() -> None:
+    """Convert old two-file entries to records and delete the old files."""
+    if not BASE_CACHE_DIR.exists():
+        return
+    for era_dir in BASE_CACHE_DIR.iterdir():
+        if not era_dir.is_dir():
+            continue
+        for css_path in era_dir.glob(f"*{_LEGACY_CSS_SUFFIX}"):
+            stem = css_path.name[:-len(_LEGACY_CSS_SUFFIX)]
+            meta_path = era_dir / f"{stem}{_LEGACY_META_SUFFIX}"
+            record_path = era_dir / f"{stem}.json"
+            if not record_path.exists():
+                try:
+                    record = {
+                        "css": css_path.read_text(encoding="utf-8"),
+                        "metadata": _json_loads(meta_path.read_bytes()),
+                    }
+                    _write_atomic(record_path, _json_dumps(record))
+                except Exception:
+                    pass  # an entry without readable metadata never hit anyway
+            for path in (css_path, meta_path):
+                with contextlib.suppress(OSError):
+                    path.unlink()
+        # Metadata left without its CSS; a current record whose domain happens
+        # to end in "-metadata" has a "css" key and is kept
+        for meta_path in era_dir.glob(f"*{_LEGACY_META_SUFFIX}"):
+            try:
+                if "css" in _json_loads(meta_path.read_bytes()):
+                    continue
+            except Exception:
+                pass
+            with contextlib.suppress(OSError):
+                meta_path.unlink()
 
 
 def _load_stats() -> Dict[str, Any]:
     if STATS_FILE.exists():
         try:
-            return json.loads(STATS_FILE.read_text(encoding="utf-8"))
+            return _json_loads(STATS_FILE.read_bytes())
         except Exception:
             return {"hits": 0, "misses": 0, "last_updated": None, "total_size_bytes": 0}
     return {"hits": 0, "misses": 0, "last_updated": None, "total_size_bytes": 0}
@@ -47,28 +188,94 @@ def _load_stats() -> Dict[str, Any]:
 
 def _save_stats(stats: Dict[str, Any]) -> None:
     BASE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
-    STATS_FILE.write_text(json.dumps(stats, indent=2), encoding="utf-8")
+    STATS_FILE.write_bytes(_json_dumps(stats))
+
+
+def _get_stats() -> Dict[str, Any]:
+    """Return the in-memory stats, loading them on first use. Caller holds _stats_lock."""
+    global _stats
+    if _stats is None:
+        _stats = _load_stats()
+        if _stats.get("layout", 1) < CACHE_LAYOUT_VERSION:
+            # The running size total still counts the legacy files
+            _migrate_legacy_entries()
+            _stats["layout"] = CACHE_LAYOUT_VERSION
+            _stats["total_size_bytes"] = get_total_cache_size_bytes()
+            _save_stats(_stats)
+    return _stats
+
+
+def flush_stats() -> None:
+    """Write pending in-memory stats to disk."""
+    global _stats_dirty
+    with _stats_lock:
+        if _stats is None or not _stats_dirty:
+            return
+        _save_stats(_stats)
+        _stats_dirty = 0
+
+
+atexit.register(flush_stats)
+
+
+def _file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
 
 
 def get_total_cache_size_bytes() -> int:
+    """Scan the cache tree and sum file sizes (O(files); not for the request path)."""
     if not BASE_CACHE_DIR.exists():
         return 0
+    # DirEntry caches the file type from the directory listing, so only
+    # regular files need a stat() call
     total = 0
-    for path in BASE_CACHE_DIR.rglob("*"):
-        if path.is_file():
-            total += path.stat().st_size
+    stack = [str(BASE_CACHE_DIR)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+                elif entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+    return total
+
+
+def get_cache_size_bytes() -> int:
+    """Return the running cache size total maintained in the stats."""
+    with _stats_lock:
+        return int(_get_stats().get("total_size_bytes", 0))
+
+
+def recompute_cache_size_bytes() -> int:
+    """Rescan the cache tree and reset the running size total."""
+    global _stats_dirty
+    total = get_total_cache_size_bytes()
+    with _stats_lock:
+        stats = _get_stats()
+        stats["total_size_bytes"] = total
+        stats["last_updated"] = _iso_now()
+        _save_stats(stats)
+        _stats_dirty = 0
     return total
 
 
-def _update_stats(hit: Optional[bool]) -> None:
-    stats = _load_stats()
-    if hit is True:
-        stats["hits"] = int(stats.get("hits", 0)) + 1
-    elif hit is False:
-        stats["misses"] = int(stats.get("misses", 0)) + 1
-    stats["total_size_bytes"] = get_total_cache_size_bytes()
-    stats["last_updated"] = datetime.now(timezone.utc).isoformat()
-    _save_stats(stats)
+def _update_stats(hit: Optional[bool], delta_bytes: int = 0) -> None:
+    global _stats_dirty
+    with _stats_lock:
+        stats = _get_stats()
+        if hit is True:
+            stats["hits"] = int(stats.get("hits", 0)) + 1
+        elif hit is False:
+            stats["misses"] = int(stats.get("misses", 0)) + 1
+        stats["total_size_bytes"] = max(0, int(stats.get("total_size_bytes", 0)) + delta_bytes)
+        stats["last_updated"] = _iso_now()
+        _stats_dirty += 1
+        if _stats_dirty >= STATS_FLUSH_EVERY:
+            _save_stats(stats)
+            _stats_dirty = 0
 
 
 def build_cache_key(domain: str, era: str, dom_digest: str) -> str:
@@ -76,35 +283,61 @@ def build_cache_key(domain: str, era: str, dom_digest: str) -> str:
     return f"{domain}-{era}-{digest_part}"
 
 
-def get_cached_style(domain: str, era: str, dom_digest: str) -> Optional[Dict[str, Any]]:
-    css_path, meta_path = _get_cache_paths(domain, era)
+def _memo_get(key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+    with _style_memo_lock:
+        entry = _style_memo.get(key)
+        if entry is not None:
+            _style_memo.move_to_end(key)
+        return entry
 
-    if not css_path.exists() or not meta_path.exists():
-        _update_stats(hit=False)
+
+def _memo_put(key: Tuple[str, str], entry: Dict[str, Any]) -> None:
+    with _style_memo_lock:
+        _style_memo[key] = entry
+        _style_memo.move_to_end(key)
+        if len(_style_memo) > STYLE_MEMO_MAX:
+            _style_memo.popitem(last=False)
+
+
+def _read_cached_record(domain: str, era: str) -> Optional[Dict[str, Any]]:
+    if _stats is None:
+        # Loading the stats first converts any legacy entry for this domain
+        with _stats_lock:
+            _get_stats()
+    record_path = _get_record_path(domain, era)
+
+    if not record_path.exists():
         return None
 
     try:
-        metadata = json.loads(meta_path.read_text(encoding="utf-8"))
+        record = _json_loads(_read_bytes(record_path))
+        return {"css": record["css"], "metadata": record["metadata"]}
     except Exception:
-        _update_stats(hit=False)
         return None
 
-    cached_digest = metadata.get("dom_digest", "")
-    if dom_digest and cached_digest and dom_digest != cached_digest:
-        _update_stats(hit=False)
-        return None
 
-    try:
-        css = css_path.read_text(encoding="utf-8")
-    except Exception:
+def get_cached_style(domain: str, era: str, dom_digest: str) -> Optional[Dict[str, Any]]:
+    key = (domain, era)
+    entry = _memo_get(key)
+    if entry is None:
+        entry = _read_cached_record(domain, era)
+        if entry is None:
+            _update_stats(hit=False)
+            return None
+        _memo_put(key, entry)
+
+    cached_digest = entry["metadata"].get("dom_digest", "")
+    if dom_digest and cached_digest and dom_digest != cached_digest:
         _update_stats(hit=False)
         return None
 
+    # Callers may annotate the metadata, so hand out a copy
+    metadata = dict(entry["metadata"])
     if "cache_key" not in metadata:
         metadata["cache_key"] = build_cache_key(domain, era, dom_digest or cached_digest)
 
     _update_stats(hit=True)
-    return {"css": css, "metadata": metadata}
+    return {"css": entry["css"], "metadata": metadata}
 
 
 def save_cached_style(
@@ -114,19 +347,21 @@ def save_cached_style(
     dom_digest: str,
     approval_status: str = "unapproved",
 ) -> Dict[str, Any]:
-    css_path, meta_path = _get_cache_paths(domain, era)
-    css_path.write_text(css, encoding="utf-8")
+    record_path = _get_record_path(domain, era)
+    previous_bytes = _file_size(record_path)
 
     metadata = {
         "domain": domain,
         "era": era,
-        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "timestamp": _iso_now(),
         "approval_status": approval_status,
         "dom_digest": dom_digest,
         "cache_key": build_cache_key(domain, era, dom_digest),
         "css_bytes": len(css.encode("utf-8"))
     }
 
-    meta_path.write_text(json.dumps(metadata, indent=2), encoding="utf-8")
-    _update_stats(hit=None)
+    data = _json_dumps({"css": css, "metadata": metadata})
+    _write_atomic(record_path, data)
+    _update_stats(hit=None, delta_bytes=len(data) - previous_bytes)
+    _memo_put((domain, era), {"css": css, "metadata": dict(metadata)})
     return metadata
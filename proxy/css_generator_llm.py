@@ -3,7 +3,7 @@ CSS Generation Orchestrator: Ties together all modules (DOM reducer, LLM, token
 
 Pipeline:
 1. Fetch HTML (external) or use provided HTML
-2. Reduce DOM to summary
+2. Reduce DOM to summary (reusing cached CSS for a known layout)
 3. Build era-specific prompt
 4. Run LLM inference (with timeout)
 5. Parse token output
@@ -12,22 +12,30 @@ Pipeline:
 8. Return result or fallback
 """
 
+import concurrent.futures
+import hashlib
 import logging
+import queue
+import threading
 import time
-from typing import Dict, Any, Optional
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
 
 from dom_reducer import reduce_dom, format_summary_for_prompt
 from css_token_format import (
     get_era_prompt,
-    parse_token_output,
-    expand_tokens_to_css,
+    Rule,
+    StreamingTokenParser,
+    expand_rule_to_css,
+    CSS_HEADER,
     normalize_era_key,
-    get_valid_eras
+    get_valid_era_set
 )
-from llm_engine import generate_tokens, get_model_info
-from css_validator import validate_css, sanitize_css
+from llm_engine import generate_tokens_stream, get_model_info
+from css_validator import sanitize_and_validate
 from fallback_styles import get_fallback_css
 from feedback_storage import store_feedback, validate_feedback
+from response_cache import response_key, get_response, put_response
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +45,175 @@ class CSSGenerationError(Exception):
     pass
 
 
+# In-process LRU of successful results, keyed by (era, page key, feedback type, feedback text)
+RESULT_CACHE_MAX = 512
+_result_cache: "OrderedDict[Tuple[str, str, str, str], Dict[str, Any]]" = OrderedDict()
+_result_cache_lock = threading.Lock()
+
+
+def _result_cache_key(era: str, html: str, dom_digest: str, feedback: Optional[Dict[str, str]]) -> Tuple[str, str, str, str]:
+    page_key = dom_digest or hashlib.blake2b(html.encode("utf-8", "replace"), digest_size=16).hexdigest()
+    feedback = feedback or {}
+    return (era, page_key, feedback.get("type", ""), feedback.get("text", ""))
+
+
+def _result_cache_get(key: Tuple[str, str, str, str]) -> Optional[Dict[str, Any]]:
+    with _result_cache_lock:
+        result = _result_cache.get(key)
+        if result is not None:
+            _result_cache.move_to_end(key)
+        return result
+
+
+def _result_cache_put(key: Tuple[str, str, str, str], result: Dict[str, Any]) -> None:
+    with _result_cache_lock:
+        _result_cache[key] = result
+        _result_cache.move_to_end(key)
+        if len(_result_cache) > RESULT_CACHE_MAX:
+            _result_cache.popitem(last=False)
+
+
+def _stream_rules(prompt: str, timeout_sec: int) -> Tuple[List[Rule], str, int]:
+    """
+    Run inference, parsing and expanding rules while tokens are still decoding.
+    
+    Returns:
+        (rules, css_body, output_chars) where css_body is the expanded CSS
+        without the header and output_chars is the raw token output length
+    """
+    parser = StreamingTokenParser()
+    rules: List[Rule] = []
+    blocks: List[str] = []
+    output_chars = 0
+    for chunk in generate_tokens_stream(prompt, timeout_sec=timeout_sec):
+        output_chars += len(chunk)
+        for rule in parser.feed(chunk):
+            rules.append(rule)
+            blocks.append(expand_rule_to_css(rule))
+    for rule in parser.close():
+        rules.append(rule)
+        blocks.append(expand_rule_to_css(rule))
+    return rules, "".join(blocks), output_chars
+
+
+# LRU of reduce_dom() summaries keyed by DOM digest (the client's dom_digest
+# and the digest reduce_dom computed), so repeat visits skip HTML parsing.
+# Cached summaries are shared and must be treated as read-only.
+DOM_SUMMARY_CACHE_MAX = 256
+_dom_summary_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_dom_summary_cache_lock = threading.Lock()
+
+
+def _reduce_dom_cached(html: str, dom_digest: str) -> Dict[str, Any]:
+    if dom_digest:
+        with _dom_summary_cache_lock:
+            summary = _dom_summary_cache.get(dom_digest)
+            if summary is not None:
+                _dom_summary_cache.move_to_end(dom_digest)
+                return summary
+    
+    summary = reduce_dom(html)
+    if summary.get("status") != "ok":
+        return summary
+    
+    with _dom_summary_cache_lock:
+        for key in {dom_digest, summary.get("digest", "")}:
+            if key:
+                _dom_summary_cache[key] = summary
+                _dom_summary_cache.move_to_end(key)
+        while len(_dom_summary_cache) > DOM_SUMMARY_CACHE_MAX:
+            _dom_summary_cache.popitem(last=False)
+    return summary
+
+
+# Inference runs on a single worker thread (the llama.cpp model is not safe
+# for concurrent calls). Requests that queue up while a generation is running
+# are drained together and identical prompts share one inference.
+INFERENCE_BATCH_MAX = 8
+_inference_queue: "queue.Queue[Tuple[str, int, concurrent.futures.Future]]" = queue.Queue()
+_inference_worker: Optional[threading.Thread] = None
+_inference_worker_lock = threading.Lock()
+
+
+def _run_inference_worker() -> None:
+    while True:
+        batch = [_inference_queue.get()]
+        while len(batch) < INFERENCE_BATCH_MAX:
+            try:
+                batch.append(_inference_queue.get_nowait())
+            except queue.Empty:
+                break
+        
+        groups: Dict[Tuple[str, int], list] = {}
+        for prompt, timeout_sec, future in batch:
+            # Skip requests whose caller already gave up
+            if future.set_running_or_notify_cancel():
+                groups.setdefault((prompt, timeout_sec), []).append(future)
+        
+        for (prompt, timeout_sec), futures in groups.items():
+            if len(futures) > 1:
+                logger.info("Coalescing %d identical inference requests", len(futures))
+            try:
+                generated = _stream_rules(prompt, timeout_sec)
+            except BaseException as e:
+                for future in futures:
+                    future.set_exception(e)
+            else:
+                for future in futures:
+                    future.set_result(generated)
+
+
+def _submit_inference(prompt: str, timeout_sec: int) -> concurrent.futures.Future:
+    global _inference_worker
+    if _inference_worker is None:
+        with _inference_worker_lock:
+            if _inference_worker is None:
+                _inference_worker = threading.Thread(
+                    target=_run_inference_worker, name="llm-inference", daemon=True
+                )
+                _inference_worker.start()
+    future: concurrent.futures.Future = concurrent.futures.Future()
+    _inference_queue.put((prompt, timeout_sec, future))
+    return future
+
+
+def _generate_rules_queued(prompt: str, timeout_sec: int) -> Tuple[List[Rule], str, int]:
+    """Run inference on the worker thread, waiting at most timeout_sec for _stream_rules() output."""
+    future = _submit_inference(prompt, timeout_sec)
+    try:
+        return future.result(timeout=timeout_sec)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise TimeoutError(f"Generation did not finish within {timeout_sec}s")
+
+
+def _fallback_result(
+    era: str,
+    start_ns: int,
+    cache_key: str,
+    reason: str,
+    feedback: Optional[Dict[str, str]],
+    domain: str,
+    dom_digest: str,
+) -> Dict[str, Any]:
+    """Build the fallback response (and record feedback) for a failed generation."""
+    if feedback and domain:
+        store_feedback(domain, era, feedback, dom_digest or cache_key, cache_key)
+    
+    return {
+        "status": "fallback",
+        "css": get_fallback_css(era),
+        "cache_key": cache_key,
+        "metadata": {
+            "era": era,
+            "generation_ms": (time.perf_counter_ns() - start_ns) // 1_000_000,
+            "fallback": True,
+            "fallback_reason": reason,
+            "dom_digest": cache_key,
+        },
+    }
+
+
 def generate_css_with_llm(
     html: str,
     era: str,
@@ -65,13 +242,13 @@ def generate_css_with_llm(
             error: error message if status is error
         }
     """
-    start_time = time.time()
+    start_ns = time.perf_counter_ns()
     
     # Validate and normalize feedback
     if feedback:
         is_valid, error_msg, normalized_feedback = validate_feedback(feedback)
         if not is_valid:
-            logger.warning(f"Invalid feedback data: {error_msg}")
+            logger.warning("Invalid feedback data: %s", error_msg)
             normalized_feedback = None
         feedback = normalized_feedback
     
@@ -86,145 +263,110 @@ def generate_css_with_llm(
         )
         
         # Step 1: Validate era
-        valid_eras = get_valid_eras()
-        if normalized_era not in valid_eras:
-            raise CSSGenerationError(f"Unknown era: {era}. Valid: {valid_eras}")
+        if normalized_era not in get_valid_era_set():
+            raise CSSGenerationError(f"Unknown era: {era}. Valid: {sorted(get_valid_era_set())}")
+        
+        # Serve a repeat of a previous successful generation from memory,
+        # unless the user explicitly asked for a fresh one
+        result_key = _result_cache_key(normalized_era, html, dom_digest, feedback)
+        regenerate = bool(feedback) and feedback.get("type") == "regenerate"
+        cached = None if regenerate else _result_cache_get(result_key)
+        if cached is not None:
+            logger.info("Result cache hit for era=%s", normalized_era)
+            if feedback and domain:
+                store_feedback(domain, normalized_era, feedback, dom_digest or cached["cache_key"], cached["cache_key"])
+            result = dict(cached)
+            result["metadata"] = dict(
+                cached["metadata"],
+                generation_ms=(time.perf_counter_ns() - start_ns) // 1_000_000,
+                cache_hit=True,
+            )
+            return result
         
         # Step 2: Reduce DOM
         logger.debug("Reducing DOM...")
-        summary = reduce_dom(html)
+        summary = _reduce_dom_cached(html, dom_digest)
         if summary.get("status") != "ok":
             raise CSSGenerationError(f"DOM reduction failed: {summary.get('error')}")
         computed_digest = summary.get("digest", "")
         
+        # Different HTML can reduce to a layout that was already styled
+        layout_key = response_key(normalized_era, computed_digest, feedback)
+        cached_css = None if regenerate else get_response(layout_key)
+        if cached_css is not None:
+            logger.info("Response cache hit for era=%s, digest=%s", normalized_era, computed_digest[:16])
+            if feedback and domain:
+                store_feedback(domain, normalized_era, feedback, dom_digest or computed_digest, computed_digest)
+            result = {
+                "status": "ok",
+                "css": cached_css,
+                "cache_key": computed_digest,
+                "metadata": {
+                    "era": normalized_era,
+                    "generation_ms": (time.perf_counter_ns() - start_ns) // 1_000_000,
+                    "fallback": False,
+                    "dom_digest": computed_digest,
+                },
+            }
+            _result_cache_put(result_key, dict(result, metadata=dict(result["metadata"])))
+            result["metadata"]["cache_hit"] = True
+            return result
+        
         # Step 3: Format for prompt
         logger.debug("Formatting prompt...")
         prompt_snippet = format_summary_for_prompt(summary)
         
         # Step 4: Build era prompt (with feedback adjustment)
-        logger.debug(f"Building {normalized_era} prompt...")
+        logger.debug("Building %s prompt...", normalized_era)
         prompt = get_era_prompt(normalized_era, prompt_snippet, feedback)
-        logger.debug(f"Prompt size: {len(prompt)} chars")
+        logger.debug("Prompt size: %d chars", len(prompt))
         
-        # Step 5: Run LLM inference
-        logger.info(f"Running LLM inference (timeout={timeout_sec}s)...")
+        # Step 5: Run LLM inference (tokens are parsed and expanded as they stream)
+        logger.info("Running LLM inference (timeout=%ss)...", timeout_sec)
         try:
-            token_output = generate_tokens(prompt, timeout_sec=timeout_sec)
+            rules, css_body, output_chars = _generate_rules_queued(prompt, timeout_sec)
         except TimeoutError:
             logger.warning("LLM inference timed out, using fallback")
-            cache_key = computed_digest
-            elapsed = time.time() - start_time
-            
-            # Store feedback if provided
-            if feedback and domain:
-                store_feedback(domain, normalized_era, feedback, dom_digest or cache_key, cache_key)
-            
-            return {
-                "status": "fallback",
-                "css": get_fallback_css(normalized_era),
-                "cache_key": cache_key,
-                "metadata": {
-                    "era": normalized_era,
-                    "generation_ms": int((time.time() - start_time) * 1000),
-                    "fallback": True,
-                    "fallback_reason": "timeout",
-                    "dom_digest": cache_key,
-                },
-            }
+            return _fallback_result(
+                normalized_era, start_ns, computed_digest, "timeout", feedback, domain, dom_digest
+            )
         except Exception as e:
-            logger.error(f"LLM error: {e}")
-            cache_key = computed_digest
-            
-            # Store feedback if provided
-            if feedback and domain:
-                store_feedback(domain, normalized_era, feedback, dom_digest or cache_key, cache_key)
-            
-            return {
-                "status": "fallback",
-                "css": get_fallback_css(normalized_era),
-                "cache_key": cache_key,
-                "metadata": {
-                    "era": normalized_era,
-                    "generation_ms": int((time.time() - start_time) * 1000),
-                    "fallback": True,
-                    "fallback_reason": str(e)[:50],
-                    "dom_digest": cache_key,
-                },
-            }
+            logger.error("LLM error: %s", e)
+            return _fallback_result(
+                normalized_era, start_ns, computed_digest, str(e)[:50], feedback, domain, dom_digest
+            )
         
-        # Step 6: Parse tokens
-        logger.debug("Parsing token output...")
-        try:
-            rules = parse_token_output(token_output)
-            if not rules:
-                raise CSSGenerationError("No CSS rules generated")
-        except Exception as e:
-            logger.error(f"Token parsing failed: {e}")
-            cache_key = computed_digest
-            
-            # Store feedback if provided
-            if feedback and domain:
-                store_feedback(domain, normalized_era, feedback, dom_digest or cache_key, cache_key)
-            
-            return {
-                "status": "fallback",
-                "css": get_fallback_css(normalized_era),
-                "cache_key": cache_key,
-                "metadata": {
-                    "era": normalized_era,
-                    "generation_ms": int((time.time() - start_time) * 1000),
-                    "fallback": True,
-                    "fallback_reason": "parse_error",
-                    "dom_digest": cache_key,
-                },
-            }
+        # Step 6: Check parsed rules
+        if not rules:
+            logger.error("Token parsing failed: No CSS rules generated")
+            return _fallback_result(
+                normalized_era, start_ns, computed_digest, "parse_error", feedback, domain, dom_digest
+            )
         
-        # Step 7: Expand to CSS
-        logger.debug("Expanding tokens to CSS...")
-        css = expand_tokens_to_css(rules)
-        logger.info(f"CSS generated: {len(css)} bytes, {len(rules)} rules")
+        # Step 7: Assemble CSS
+        css = CSS_HEADER + css_body
+        logger.info("CSS generated: %d bytes, %d rules", len(css), len(rules))
         
-        # Step 8: Validate CSS
+        # Step 8: Validate CSS (sanitizing once if needed)
         logger.debug("Validating CSS...")
-        valid, error_msg = validate_css(css)
+        valid, css, error_msg = sanitize_and_validate(css)
         if not valid:
-            logger.warning(f"CSS validation failed: {error_msg}")
-            # Try sanitizing and re-validating
-            css_sanitized = sanitize_css(css)
-            valid, error_msg = validate_css(css_sanitized)
-            if not valid:
-                logger.error("Sanitized CSS still invalid, using fallback")
-                cache_key = computed_digest
-                
-                # Store feedback if provided
-                if feedback and domain:
-                    store_feedback(domain, normalized_era, feedback, dom_digest or cache_key, cache_key)
-                
-                return {
-                    "status": "fallback",
-                    "css": get_fallback_css(normalized_era),
-                    "cache_key": cache_key,
-                    "metadata": {
-                        "era": normalized_era,
-                        "generation_ms": int((time.time() - start_time) * 1000),
-                        "fallback": True,
-                        "fallback_reason": "validation_failed",
-                        "dom_digest": cache_key,
-                    },
-                }
-            css = css_sanitized
+            logger.error("Sanitized CSS still invalid, using fallback: %s", error_msg)
+            return _fallback_result(
+                normalized_era, start_ns, computed_digest, "validation_failed", feedback, domain, dom_digest
+            )
         
         # Success!
-        elapsed_ms = int((time.time() - start_time) * 1000)
+        elapsed_ms = (time.perf_counter_ns() - start_ns) // 1_000_000
         cache_key = computed_digest
         
         # Store feedback if provided
         if feedback and domain:
             store_feedback(domain, normalized_era, feedback, dom_digest or cache_key, cache_key)
         
-        logger.info(f"CSS generation complete in {elapsed_ms}ms")
+        logger.info("CSS generation complete in %dms", elapsed_ms)
         
-        return {
+        result = {
             "status": "ok",
             "css": css,
             "cache_key": cache_key,
@@ -233,20 +375,23 @@ def generate_css_with_llm(
                 "generation_ms": elapsed_ms,
                 "fallback": False,
                 "rules_count": len(rules),
-                "token_output_chars": len(token_output),
+                "token_output_chars": output_chars,
                 "dom_digest": cache_key,
             },
         }
+        _result_cache_put(result_key, dict(result, metadata=dict(result["metadata"])))
+        put_response(layout_key, css)
+        return result
     
     except Exception as e:
-        logger.error(f"Unexpected error in CSS generation: {e}")
+        logger.error("Unexpected error in CSS generation: %s", e)
         return {
             "status": "error",
             "css": None,
             "error": str(e)[:100],
             "metadata": {
                 "era": normalized_era if 'normalized_era' in locals() else era,
-                "generation_ms": int((time.time() - start_time) * 1000),
+                "generation_ms": (time.perf_counter_ns() - start_ns) // 1_000_000,
             },
         }
 
@@ -5,17 +5,38 @@ Defines how the LLM outputs CSS (token format) and prompt engineering
 for each era to ensure consistent, era-appropriate styling.
 """
 
+import functools
 import json
 import logging
+import re
+import sys
+from io import StringIO
 from pathlib import Path
-from typing import Dict, List, Any, Optional
-from enum import Enum
+from typing import Dict, FrozenSet, List, Any, NamedTuple, Optional, Tuple
+
+__all__ = [
+    "CSSToken",
+    "DEFAULT_ERA_DESIGN",
+    "CSS_HEADER",
+    "Rule",
+    "StreamingTokenParser",
+    "load_era_tokens",
+    "normalize_era_key",
+    "get_valid_eras",
+    "get_valid_era_set",
+    "get_era_design",
+    "get_era_prompt_parts",
+    "get_era_prompt",
+    "parse_token_output",
+    "expand_tokens_to_css",
+    "expand_rule_to_css",
+]
 
 logger = logging.getLogger(__name__)
 
 
-class CSSToken(Enum):
-    """CSS properties the LLM can emit as tokens."""
+class CSSToken:
+    """CSS properties the LLM can emit as tokens (plain strings, as parsed)."""
     BACKGROUND = "BACKGROUND"
     COLOR = "COLOR"
     FONT_FAMILY = "FONT_FAMILY"
@@ -114,6 +135,7 @@ DEFAULT_ERA_DESIGN = {
 }
 
 _ERA_TOKENS_CACHE: Optional[Dict[str, Any]] = None
+_VALID_ERAS: Optional[FrozenSet[str]] = None
 
 
 def _find_tokens_path() -> Optional[Path]:
@@ -196,6 +218,14 @@ def get_valid_eras() -> List[str]:
     return list(DEFAULT_ERA_DESIGN.keys())
 
 
+def get_valid_era_set() -> FrozenSet[str]:
+    """Valid era keys as a frozenset for O(1) membership tests on the hot path."""
+    global _VALID_ERAS
+    if _VALID_ERAS is None:
+        _VALID_ERAS = frozenset(get_valid_eras())
+    return _VALID_ERAS
+
+
 def _design_from_tokens(era_key: str) -> Optional[Dict[str, Any]]:
     tokens = load_era_tokens() or {}
     era_data = tokens.get("eras", {}).get(era_key)
@@ -228,27 +258,67 @@ def get_era_design(era: str) -> Dict[str, Any]:
     raise ValueError(f"Unknown era: {era}")
 
 
-def get_era_prompt(era: str, dom_summary: str, feedback: Dict[str, str] = None) -> str:
-    """
-    Generate a specialized prompt for the LLM based on era and DOM.
-    
-    Args:
-        era: Era name (win95, win98, winxp, web1996)
-        dom_summary: Output from dom_reducer.format_summary_for_prompt()
-        feedback: Optional feedback dict with 'type' and 'text'
-    
-    Returns:
-        A structured prompt for the LLM
-    """
-    design = get_era_design(era)
+# Adjustment instructions for preset feedback types
+_FEEDBACK_ADJUSTMENTS = {
+    "too_modern": """
+ADJUSTMENT (User feedback: styles too modern):
+- Use darker, more retro color schemes
+- Add more beveled 3D borders and effects
+- Increase use of era-characteristic design
+- Make buttons more prominent with bevels
+- Use system fonts appropriate to the era""",
+    "too_simple": """
+ADJUSTMENT (User feedback: styles too simple):
+- Improve typography with better hierarchy
+- Add subtle box-shadows or gradients where appropriate
+- Use more decorative borders and separators
+- Enhance visual distinction between elements
+- Add more color variation and depth""",
+    "simplify_layout": """
+ADJUSTMENT (User feedback: layout too complex):
+- Reduce border styles and visual noise
+- Simplify color schemes (use fewer colors)
+- Remove unnecessary decorative effects
+- Keep styling minimal but era-appropriate
+- Focus on readability and simplicity""",
+    "make_usable": """
+ADJUSTMENT (User feedback: improve usability):
+- Ensure high contrast for text readability
+- Make interactive elements clearly distinguishable
+- Improve button visibility and padding
+- Ensure sufficient spacing between elements
+- Prioritize clarity and functionality over aesthetics""",
+    "good": """
+ADJUSTMENT (User feedback: good result):
+- Continue with similar approach
+- Apply same style principles to other elements
+- Maintain consistency with what worked well""",
+}
+
+# Closing instruction when no feedback note is appended
+_PROMPT_CLOSE = """
+---
+Generate the CSS tokens now:
+"""
+
+
+# The static, era-only prompt prefix is rendered once per era key. Everything
+# that depends on the request (DOM summary, feedback) goes after it, so
+# repeated prompts for an era share a byte-identical prefix the backend can reuse.
+@functools.lru_cache(maxsize=8)
+def _era_prompt_prefix(era_key: str) -> str:
+    """Render the era-dependent prompt text that precedes the DOM summary."""
+    design = get_era_design(era_key)
     colors = design["colors"]
+    characteristics = "\n".join(["- " + c for c in design["characteristics"]])
+    fonts_csv = ", ".join(design["fonts"])
     
-    prompt = f"""You are a CSS styling expert. Generate era-appropriate CSS for a webpage.
+    return f"""You are a CSS styling expert. Generate era-appropriate CSS for a webpage.
 
 ERA: {design['name']}
 ---
 Key characteristics of this era:
-{chr(10).join(f"- {c}" for c in design['characteristics'])}
+{characteristics}
 
 Color palette:
 - Primary: {colors['primary']}
@@ -257,14 +327,10 @@ Color palette:
 - Background: {colors['background']}
 - Text: {colors['text']}
 
-Preferred fonts: {', '.join(design['fonts'])}
-
----
-PAGE STRUCTURE:
-{dom_summary}
+Preferred fonts: {fonts_csv}
 
 ---
-TASK: Generate CSS rules that apply {design['name']} styling to this page.
+TASK: Generate CSS rules that apply {design['name']} styling to the page described below.
 
 RULES:
 1. Output ONLY CSS tokens in the format below. No explanations.
@@ -286,66 +352,29 @@ RULE a
   PROPERTY: TEXT_DECORATION underline
 
 ---
-Generate the CSS tokens now:
+PAGE STRUCTURE:
 """
-    
-    if feedback and (feedback.get('type') or feedback.get('text')):
-        feedback_type = feedback.get('type', 'other')
-        feedback_text = feedback.get('text', '')
-        
-        # Build feedback adjustment instructions based on type
-        adjustments = ""
-        if feedback_type == "too_modern":
-            adjustments = """
-ADJUSTMENT (User feedback: styles too modern):
-- Use darker, more retro color schemes
-- Add more beveled 3D borders and effects
-- Increase use of era-characteristic design
-- Make buttons more prominent with bevels
-- Use system fonts appropriate to the era"""
-        
-        elif feedback_type == "too_simple":
-            adjustments = """
-ADJUSTMENT (User feedback: styles too simple):
-- Improve typography with better hierarchy
-- Add subtle box-shadows or gradients where appropriate
-- Use more decorative borders and separators
-- Enhance visual distinction between elements
-- Add more color variation and depth"""
-        
-        elif feedback_type == "simplify_layout":
-            adjustments = """
-ADJUSTMENT (User feedback: layout too complex):
-- Reduce border styles and visual noise
-- Simplify color schemes (use fewer colors)
-- Remove unnecessary decorative effects
-- Keep styling minimal but era-appropriate
-- Focus on readability and simplicity"""
-        
-        elif feedback_type == "make_usable":
-            adjustments = """
-ADJUSTMENT (User feedback: improve usability):
-- Ensure high contrast for text readability
-- Make interactive elements clearly distinguishable
-- Improve button visibility and padding
-- Ensure sufficient spacing between elements
-- Prioritize clarity and functionality over aesthetics"""
-        
-        elif feedback_type == "good":
-            adjustments = """
-ADJUSTMENT (User feedback: good result):
-- Continue with similar approach
-- Apply same style principles to other elements
-- Maintain consistency with what worked well"""
-        
-        else:
-            # Generic or custom feedback
-            adjustments = f"""
+
+
+# Render every known era's prefix at import so no request pays for it
+try:
+    for _era_key in get_valid_eras():
+        _era_prompt_prefix(_era_key)
+except Exception as exc:
+    logger.warning("Could not pre-render era prompts: %s", exc)
+
+
+def _build_feedback_note(feedback_type: str, feedback_text: str) -> str:
+    # Build feedback adjustment instructions based on type
+    adjustments = _FEEDBACK_ADJUSTMENTS.get(feedback_type)
+    if adjustments is None:
+        # Generic or custom feedback
+        adjustments = f"""
 ADJUSTMENT (User feedback: {feedback_text}):
 - Apply user's feedback to the generation
 - Incorporate their suggestions while maintaining era accuracy"""
-        
-        feedback_note = f"""
+    
+    return f"""
 ---
 FEEDBACK FROM PREVIOUS GENERATION:
 Type: {feedback_type}
@@ -357,12 +386,78 @@ Please regenerate the CSS with these adjustments in mind.
 ---
 Generate the improved CSS tokens now:
 """
-        prompt += feedback_note
+
+
+# Complete notes for preset feedback without a comment (the common case)
+_PRESET_FEEDBACK_NOTES = {
+    feedback_type: _build_feedback_note(feedback_type, "")
+    for feedback_type in _FEEDBACK_ADJUSTMENTS
+}
+
+
+def get_era_prompt_parts(era: str, dom_summary: str, feedback: Dict[str, str] = None) -> Tuple[str, str]:
+    """
+    Build the LLM prompt as a (static prefix, dynamic suffix) pair.
+    
+    The prefix depends only on the era, so it is identical across requests
+    and can be reused by prefix/KV caching; the suffix holds the DOM summary
+    and any feedback note.
+    
+    Args:
+        era: Era name (win95, win98, winxp, web1996)
+        dom_summary: Output from dom_reducer.format_summary_for_prompt()
+        feedback: Optional feedback dict with 'type' and 'text'
+    
+    Returns:
+        (prefix, suffix); the full prompt is prefix + suffix
+    """
+    era_key = era if era in get_valid_era_set() else normalize_era_key(era)
+    prefix = _era_prompt_prefix(era_key)
+    
+    close = _PROMPT_CLOSE
+    if feedback and (feedback.get('type') or feedback.get('text')):
+        feedback_type = feedback.get('type', 'other')
+        feedback_text = feedback.get('text', '')
+        note = None if feedback_text else _PRESET_FEEDBACK_NOTES.get(feedback_type)
+        close = note or _build_feedback_note(feedback_type, feedback_text)
     
-    return prompt
+    return prefix, dom_summary + "\n" + close
 
 
-def parse_token_output(token_text: str) -> List[Dict[str, Any]]:
+def get_era_prompt(era: str, dom_summary: str, feedback: Dict[str, str] = None) -> str:
+    """
+    Generate a specialized prompt for the LLM based on era and DOM.
+    
+    Args:
+        era: Era name (win95, win98, winxp, web1996)
+        dom_summary: Output from dom_reducer.format_summary_for_prompt()
+        feedback: Optional feedback dict with 'type' and 'text'
+    
+    Returns:
+        A structured prompt for the LLM
+    """
+    prefix, suffix = get_era_prompt_parts(era, dom_summary, feedback)
+    return prefix + suffix
+
+
+# One token line: "RULE <selector>" or "PROPERTY: <token> <value>", with
+# surrounding whitespace on the line ignored ([^\S\n] is whitespace except newline)
+_TOKEN_LINE_RE = re.compile(
+    r"^[^\S\n]*(?:"
+    r"RULE [^\S\n]*(?P<sel>\S.*?)"
+    r"|PROPERTY:[^\S\n]*(?P<tok>\S+)[^\S\n]+(?P<val>\S.*?)"
+    r")[^\S\n]*$",
+    re.MULTILINE,
+)
+
+
+class Rule(NamedTuple):
+    """One parsed CSS rule; selector and token names are interned."""
+    selector: str
+    properties: Dict[str, str]
+
+
+def parse_token_output(token_text: str) -> List[Rule]:
     """
     Parse LLM token output into structured CSS rules.
     
@@ -378,39 +473,90 @@ def parse_token_output(token_text: str) -> List[Dict[str, Any]]:
         token_text: LLM output text
     
     Returns:
-        List of dicts: [{"selector": "body", "properties": {...}}, ...]
+        List of Rules: [Rule("body", {"BACKGROUND": "#f0f0f0", ...}), ...]
     """
-    rules = []
-    current_rule = None
+    parser = StreamingTokenParser()
+    rules = parser._consume(token_text) + parser.close()
     
-    for line in token_text.split("\n"):
-        line = line.strip()
-        
-        if line.startswith("RULE "):
-            # Save previous rule
-            if current_rule:
-                rules.append(current_rule)
-            
-            # Start new rule
-            selector = line[5:].strip()
-            current_rule = {"selector": selector, "properties": {}}
-        
-        elif line.startswith("PROPERTY:") and current_rule:
-            # Parse property
-            parts = line[9:].strip().split(None, 1)
-            if len(parts) == 2:
-                token_name, value = parts
-                current_rule["properties"][token_name] = value
+    logger.info("Parsed %d CSS rules from token output", len(rules))
+    return rules
+
+
+class StreamingTokenParser:
+    """
+    Incremental counterpart to parse_token_output() for streamed LLM output.
+    
+    feed() accepts arbitrary text chunks and returns the rules completed so far
+    (a rule is complete once the next RULE line starts); close() flushes the
+    trailing partial line and the last rule. Feeding a whole output and calling
+    close() yields the same rules as parse_token_output().
+    """
     
-    # Don't forget last rule
-    if current_rule:
-        rules.append(current_rule)
+    __slots__ = ("_pending", "_current")
     
-    logger.info(f"Parsed {len(rules)} CSS rules from token output")
-    return rules
+    def __init__(self):
+        # Chunks of the unfinished line; only joined once a newline arrives,
+        # so token-sized chunks don't re-copy the partial line every time
+        self._pending: List[str] = []
+        self._current: Optional[Rule] = None
+    
+    def feed(self, chunk: str) -> List[Rule]:
+        cut = chunk.rfind("\n") + 1
+        if not cut:
+            self._pending.append(chunk)
+            return []
+        self._pending.append(chunk[:cut])
+        text = "".join(self._pending)
+        self._pending = [chunk[cut:]]
+        return self._consume(text)
+    
+    def close(self) -> List[Rule]:
+        completed = self._consume("".join(self._pending))
+        self._pending = []
+        if self._current:
+            completed.append(self._current)
+            self._current = None
+        return completed
+    
+    def _consume(self, lines: str) -> List[Rule]:
+        completed = []
+        # findall yields (sel, tok, val) tuples straight from C; groups that did
+        # not take part in the match come back as "" (sel is never empty otherwise)
+        for selector, token, value in _TOKEN_LINE_RE.findall(lines):
+            if selector:
+                if self._current:
+                    completed.append(self._current)
+                self._current = Rule(sys.intern(selector), {})
+            elif self._current:
+                self._current.properties[sys.intern(token)] = value
+        return completed
+
+
+# Map tokens to CSS properties
+_TOKEN_MAP = {
+    "BACKGROUND": "background-color",
+    "COLOR": "color",
+    "FONT_FAMILY": "font-family",
+    "FONT_SIZE": "font-size",
+    "FONT_WEIGHT": "font-weight",
+    "BORDER": "border",
+    "BORDER_RADIUS": "border-radius",
+    "PADDING": "padding",
+    "MARGIN": "margin",
+    "TEXT_DECORATION": "text-decoration",
+    "BOX_SHADOW": "box-shadow",
+    "TEXT_SHADOW": "text-shadow",
+    "DISPLAY": "display",
+    "WIDTH": "width",
+    "HEIGHT": "height",
+}
+
 
+# Comment line every generated stylesheet starts with
+CSS_HEADER = "/* RetrOS CSS - LLM Generated */\n"
 
-def expand_tokens_to_css(rules: List[Dict[str, Any]]) -> str:
+
+def expand_tokens_to_css(rules: List[Rule]) -> str:
     """
     Convert parsed token rules into actual CSS.
     
@@ -420,41 +566,44 @@ def expand_tokens_to_css(rules: List[Dict[str, Any]]) -> str:
     Returns:
         Valid CSS string
     """
-    css_lines = ["/* RetrOS CSS - LLM Generated */", ""]
-    
-    for rule in rules:
-        selector = rule.get("selector", "")
-        properties = rule.get("properties", {})
-        
+    # One StringIO buffer instead of a formatted string per property and rule
+    out = StringIO()
+    write = out.write
+    write(CSS_HEADER)
+    for selector, properties in rules:
         if not selector or not properties:
             continue
-        
-        css_lines.append(f"{selector} {{")
-        
-        # Map tokens to CSS properties
-        token_map = {
-            "BACKGROUND": "background-color",
-            "COLOR": "color",
-            "FONT_FAMILY": "font-family",
-            "FONT_SIZE": "font-size",
-            "FONT_WEIGHT": "font-weight",
-            "BORDER": "border",
-            "BORDER_RADIUS": "border-radius",
-            "PADDING": "padding",
-            "MARGIN": "margin",
-            "TEXT_DECORATION": "text-decoration",
-            "BOX_SHADOW": "box-shadow",
-            "TEXT_SHADOW": "text-shadow",
-            "DISPLAY": "display",
-            "WIDTH": "width",
-            "HEIGHT": "height",
-        }
-        
+        write("\n")
+        write(selector)
+        write(" {\n")
         for token, value in properties.items():
-            css_prop = token_map.get(token, token.lower().replace("_", "-"))
-            css_lines.append(f"  {css_prop}: {value};")
-        
-        css_lines.append("}")
-        css_lines.append("")
+            write("  ")
+            write(_TOKEN_MAP.get(token) or token.lower().replace('_', '-'))
+            write(": ")
+            write(value)
+            write(";\n")
+        write("}\n")
+    return out.getvalue()
+
+
+def expand_rule_to_css(rule: Rule) -> str:
+    """
+    Convert a single parsed rule into its CSS block (same text as
+    expand_tokens_to_css produces for it; used when streaming).
+    
+    Args:
+        rule: One rule from parse_token_output() or StreamingTokenParser
+    
+    Returns:
+        CSS block, or "" if the rule has no selector or no properties
+    """
+    selector, properties = rule
     
-    return "\n".join(css_lines)
+    if not selector or not properties:
+        return ""
+    
+    props_css = "".join(
+        f"  {_TOKEN_MAP.get(token) or token.lower().replace('_', '-')}: {value};\n"
+        for token, value in properties.items()
+    )
+    return f"\n{selector} {{\n{props_css}}}\n"
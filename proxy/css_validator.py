@@ -12,6 +12,30 @@ import re
 
 logger = logging.getLogger(__name__)
 
+# Dangerous constructs validate_css() reports, with their error messages
+_DANGEROUS_RES = [
+    (re.compile(r"@import\s*['\"]", re.IGNORECASE), "Dangerous @import detected"),
+    (re.compile(r"javascript:", re.IGNORECASE), "JavaScript protocol detected"),
+    (re.compile(r"expression\s*\(", re.IGNORECASE), "CSS expression detected"),
+]
+
+# The same checks as a single alternation, one named group per message
+_DANGEROUS_RE = re.compile(
+    r"(?P<import>@import\s*['\"])|(?P<js>javascript:)|(?P<expr>expression\s*\()",
+    re.IGNORECASE,
+)
+_DANGEROUS_MESSAGES = (
+    ("import", "Dangerous @import detected"),
+    ("js", "JavaScript protocol detected"),
+    ("expr", "CSS expression detected"),
+)
+
+# What sanitize_css() strips, in order
+_IMPORT_RE = re.compile(r"@import\s*[^;]*;")
+_JS_RE = re.compile(r"javascript:", re.IGNORECASE)
+_EXPR_RE = re.compile(r"expression\s*\([^)]*\)", re.IGNORECASE)
+_STRIP_PATTERNS = (_IMPORT_RE, _JS_RE, _EXPR_RE)
+
 
 def validate_css(css: str) -> tuple[bool, str]:
     """
@@ -35,18 +59,13 @@ def validate_css(css: str) -> tuple[bool, str]:
         errors.append(f"Mismatched braces: {open_braces} open, {close_braces} close")
     
     # Check for dangerous directives
-    dangerous_patterns = [
-        (r"@import\s*['\"]", "Dangerous @import detected"),
-        (r"javascript:", "JavaScript protocol detected"),
-        (r"expression\s*\(", "CSS expression detected"),
-    ]
-    
-    for pattern, msg in dangerous_patterns:
-        if re.search(pattern, css, re.IGNORECASE):
+    for pattern, msg in _DANGEROUS_RES:
+        if pattern.search(css):
             errors.append(msg)
     
-    # Basic selector validation (very loose)
-    lines = css.split("\n")
+    # Basic selector validation (very loose); it only emits debug logs,
+    # so skip the per-line scan unless they would be shown
+    lines = css.split("\n") if logger.isEnabledFor(logging.DEBUG) else ()
     for i, line in enumerate(lines, 1):
         stripped = line.strip()
         
@@ -81,12 +100,59 @@ def sanitize_css(css: str) -> str:
         Sanitized CSS
     """
     # Remove @import directives
-    css = re.sub(r'@import\s*[^;]*;', '', css)
+    css = _IMPORT_RE.sub('', css)
     
     # Remove javascript: protocols
-    css = re.sub(r'javascript:', '', css, flags=re.IGNORECASE)
+    css = _JS_RE.sub('', css)
     
     # Remove expression() calls
-    css = re.sub(r'expression\s*\([^)]*\)', '', css, flags=re.IGNORECASE)
+    css = _EXPR_RE.sub('', css)
     
     return css
+
+
+def sanitize_and_validate(css: str) -> tuple[bool, str, str]:
+    """
+    Validate CSS, sanitizing it once if it fails.
+    
+    Equivalent to validate_css(), then sanitize_css() and validate_css() again
+    on failure, but valid CSS costs a single regex scan and invalid CSS is
+    checked once more after sanitizing, instead of re-running every pattern
+    and the per-line scan on both sides of sanitize_css().
+    
+    Args:
+        css: CSS string to validate
+    
+    Returns:
+        (is_valid, css_or_sanitized_css, error_message)
+    """
+    if not css or not css.strip():
+        return False, css, "CSS is empty"
+    
+    if css.count("{") == css.count("}") and not _DANGEROUS_RE.search(css):
+        logger.info("CSS validation passed")
+        return True, css, ""
+    
+    sanitized = css
+    for pattern in _STRIP_PATTERNS:
+        sanitized = pattern.sub("", sanitized)
+    if not sanitized.strip():
+        return False, sanitized, "CSS is empty"
+    
+    errors = []
+    
+    open_braces = sanitized.count("{")
+    close_braces = sanitized.count("}")
+    if open_braces != close_braces:
+        errors.append(f"Mismatched braces: {open_braces} open, {close_braces} close")
+    
+    found = {match.lastgroup for match in _DANGEROUS_RE.finditer(sanitized)}
+    errors.extend(msg for group, msg in _DANGEROUS_MESSAGES if group in found)
+    
+    if errors:
+        error_msg = "; ".join(errors)
+        logger.warning(f"CSS validation failed after sanitizing: {error_msg}")
+        return False, sanitized, error_msg
+    
+    logger.info("CSS validation passed after sanitizing")
+    return True, sanitized, ""
@@ -8,37 +8,129 @@ This keeps prompt size small and generation fast.
 import logging
 import hashlib
 import json
-from bs4 import BeautifulSoup
+import re
+import threading
+from collections import Counter
+from lxml import etree
 from typing import Dict, List, Any
 
 logger = logging.getLogger(__name__)
 
+SEMANTIC_TAGS = ["header", "nav", "main", "article", "section", "aside", "footer", "form"]
 
-def _count_elements(soup: BeautifulSoup, tag: str) -> int:
-    """Count occurrences of a tag."""
-    return len(soup.find_all(tag, recursive=True))
+# Dark-mode hints; search() stops at the first hit and needs no lowered copy
+_DARK_MODE_RE = re.compile(r"prefers-color-scheme|dark", re.IGNORECASE)
 
+# Elements whose text is code, not page content (excluded from density)
+_NON_CONTENT_TAGS = frozenset(["script", "style", "template"])
 
-def _get_element_types(soup: BeautifulSoup) -> List[str]:
-    """Extract semantic structure from page."""
-    semantic_tags = ["header", "nav", "main", "article", "section", "aside", "footer", "form"]
-    found = []
-    for tag in semantic_tags:
-        if soup.find(tag):
-            found.append(tag)
-    return found
 
+class _DomStats:
+    """
+    lxml parser target that collects every statistic reduce_dom needs as the
+    parser streams events, without building a tree.
+    
+    Text is weighted by nesting depth so text_len matches summing get_text()
+    over every element, without building those strings.
+    """
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        self.tags: Counter = Counter()
+        self.title = None
+        self.meta_desc = ""
+        self.major_divs = 0
+        self.text_len = 0
+        self._stack: List[str] = []
+        # True while incoming data is the innermost element's own text
+        # (before any child), as opposed to the tail of a closed child
+        self._leading_text = False
+        self._title_parts: List[str] = []
+        self._in_title = False
+    
+    def start(self, tag, attrib):
+        self._stack.append(tag)
+        self._leading_text = True
+        self.tags[tag] += 1
+        if self._in_title:
+            # Mirror soup.title.string: a title with child elements has none
+            self._in_title = False
+            self.title = ""
+        if tag == "div":
+            if attrib.get("id") or (attrib.get("class") or "").strip() or attrib.get("role"):
+                self.major_divs += 1
+        elif tag == "meta" and not self.meta_desc and attrib.get("name") == "description":
+            self.meta_desc = (attrib.get("content") or "").strip()[:100]
+        elif tag == "title" and self.title is None:
+            self._in_title = True
+    
+    def end(self, tag):
+        if self._in_title:
+            self._in_title = False
+            self.title = "".join(self._title_parts).strip()[:100]
+        self._stack.pop()
+        self._leading_text = False
+    
+    def data(self, text):
+        if self._leading_text and self._stack[-1] in _NON_CONTENT_TAGS:
+            return
+        self.text_len += len(text) * len(self._stack)
+        if self._in_title:
+            self._title_parts.append(text)
+    
+    def comment(self, text):
+        # Text after a comment is a tail, not leading element text
+        self._leading_text = False
+    
+    def close(self):
+        return self
 
-def _estimate_layout(soup: BeautifulSoup) -> str:
-    """Guess layout density: sparse vs dense."""
-    total_text = sum(len(t.get_text()) for t in soup.find_all())
-    total_tags = len(soup.find_all())
+
+# One reusable parser (and target) per thread; lxml parsers are not thread-safe
+_local = threading.local()
+
+
+def _get_parser():
+    parser = getattr(_local, "parser", None)
+    if parser is None:
+        _local.stats = _DomStats()
+        parser = _local.parser = etree.HTMLParser(target=_local.stats, recover=True, encoding="utf-8")
+    return parser
+
+
+def _scan_html(html: str) -> Dict[str, Any]:
+    """Collect every statistic reduce_dom needs in one streaming lxml pass."""
+    if not html.strip():
+        return {"tags": Counter(), "title": "", "meta_description": "", "major_divs": 0, "text_len": 0}
     
+    parser = _get_parser()
+    stats = _local.stats
+    stats.reset()
+    try:
+        etree.fromstring(html.encode("utf-8", "replace"), parser)
+    except etree.XMLSyntaxError:
+        # Nothing parseable (e.g. only whitespace or a bare comment)
+        if stats.tags:
+            raise
+    
+    return {
+        "tags": stats.tags,
+        "title": stats.title or "",
+        "meta_description": stats.meta_desc,
+        "major_divs": stats.major_divs,
+        "text_len": stats.text_len,
+    }
+
+
+def _estimate_layout(text_len: int, total_tags: int) -> str:
+    """Guess layout density: sparse vs dense."""
     # Ratio of text to tags
     if total_tags == 0:
         return "empty"
     
-    ratio = total_text / total_tags
+    ratio = text_len / total_tags
     
     if ratio < 5:
         return "sparse"
@@ -48,15 +140,6 @@ def _estimate_layout(soup: BeautifulSoup) -> str:
         return "dense"
 
 
-def _count_major_divs(soup: BeautifulSoup) -> int:
-    """Count divs that likely represent major layout containers."""
-    count = 0
-    for div in soup.find_all("div", recursive=True):
-        if div.get("id") or div.get("class") or div.get("role"):
-            count += 1
-    return count
-
-
 def reduce_dom(html: str, max_summary_lines: int = 100) -> Dict[str, Any]:
     """
     Convert raw HTML to a structured summary.
@@ -70,50 +153,39 @@ def reduce_dom(html: str, max_summary_lines: int = 100) -> Dict[str, Any]:
     """
     try:
         logger.debug("Reducing DOM...")
-        soup = BeautifulSoup(html, "lxml")
-        
-        # Extract title
-        title = ""
-        if soup.title and soup.title.string:
-            title = soup.title.string.strip()[:100]  # Cap at 100 chars
-        
-        # Extract meta description
-        meta_desc = ""
-        md = soup.find("meta", attrs={"name": "description"})
-        if md and md.get("content"):
-            meta_desc = md.get("content").strip()[:100]
+        scan = _scan_html(html)
+        tags = scan["tags"]
         
         # Count key elements
         layout_summary = {
-            "headers": _count_elements(soup, "h1") + _count_elements(soup, "h2") + _count_elements(soup, "h3"),
-            "navs": _count_elements(soup, "nav"),
-            "sidebars": len(soup.find_all("aside")),
-            "main_columns": len(soup.find_all("main")),
-            "forms": _count_elements(soup, "form"),
-            "tables": _count_elements(soup, "table"),
-            "images": _count_elements(soup, "img"),
-            "links": _count_elements(soup, "a"),
-            "paragraphs": _count_elements(soup, "p"),
-            "lists": _count_elements(soup, "ul") + _count_elements(soup, "ol"),
+            "headers": tags["h1"] + tags["h2"] + tags["h3"],
+            "navs": tags["nav"],
+            "sidebars": tags["aside"],
+            "main_columns": tags["main"],
+            "forms": tags["form"],
+            "tables": tags["table"],
+            "images": tags["img"],
+            "links": tags["a"],
+            "paragraphs": tags["p"],
+            "lists": tags["ul"] + tags["ol"],
         }
         
         # Semantic structure
-        element_types = _get_element_types(soup)
+        element_types = [tag for tag in SEMANTIC_TAGS if tags[tag]]
+        
+        total_elements = sum(tags.values())
         
         # Layout density
-        estimated_density = _estimate_layout(soup)
+        estimated_density = _estimate_layout(scan["text_len"], total_elements)
         
         # Check for dark mode hints
-        has_dark_mode = False
-        html_lower = html.lower()
-        if 'prefers-color-scheme' in html_lower or 'dark' in html_lower:
-            has_dark_mode = True
+        has_dark_mode = _DARK_MODE_RE.search(html) is not None
         
-        total_elements = len(soup.find_all())
-        div_count = _count_elements(soup, "div")
-        major_divs = _count_major_divs(soup)
+        div_count = tags["div"]
+        major_divs = scan["major_divs"]
 
-        # Compute deterministic fingerprint digest
+        # Compute deterministic fingerprint digest (a cache key, not a security
+        # boundary, so the faster 128-bit BLAKE2b is plenty)
         fingerprint_payload = {
             "layout_summary": layout_summary,
             "element_types": element_types,
@@ -122,12 +194,12 @@ def reduce_dom(html: str, max_summary_lines: int = 100) -> Dict[str, Any]:
             "major_divs": major_divs,
         }
         summary_text = json.dumps(fingerprint_payload, sort_keys=True, separators=(",", ":"))
-        digest = hashlib.sha256(summary_text.encode()).hexdigest()
+        digest = hashlib.blake2b(summary_text.encode(), digest_size=16).hexdigest()
         
         result = {
             "status": "ok",
-            "title": title,
-            "meta_description": meta_desc,
+            "title": scan["title"],
+            "meta_description": scan["meta_description"],
             "layout_summary": layout_summary,
             "element_types": element_types,
             "estimated_density": estimated_density,
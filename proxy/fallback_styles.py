@@ -71,7 +71,10 @@ input, textarea { background: #FFF; border: 1px solid #999; padding: 4px; border
 """,
 }
 
+# Unknown eras fall back to Windows 95
+_DEFAULT_FALLBACK_CSS = FALLBACK_STYLES["win95"]
+
 
 def get_fallback_css(era: str) -> str:
-    """Get fallback CSS for an era."""
-    return FALLBACK_STYLES.get(era, FALLBACK_STYLES["win95"])
+    """Get fallback CSS for an era (the prebuilt string, no per-call work)."""
+    return FALLBACK_STYLES.get(era, _DEFAULT_FALLBACK_CSS)
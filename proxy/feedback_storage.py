@@ -2,21 +2,38 @@
 Feedback Storage System for RetrOS
 
 Handles persistence of user feedback for analytics and future model improvements.
-Stores feedback in JSON format in the proxy directory.
+Stores feedback as append-only JSON Lines in the proxy directory, with the
+parsed history and per-type/domain/era counts kept in memory. store_feedback()
+only enqueues; a background writer thread appends entries in batches.
 """
 
+import atexit
+import heapq
 import json
 import logging
 import os
+import queue
+import threading
+import time
+from collections import Counter
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Any, Optional
 
 logger = logging.getLogger(__name__)
 
+# Try importing orjson for faster (de)serialization; fall back to stdlib json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # Feedback storage directory
 FEEDBACK_DIR = Path(__file__).parent / "feedback"
-FEEDBACK_FILE = FEEDBACK_DIR / "feedback_history.json"
+FEEDBACK_FILE = FEEDBACK_DIR / "feedback_history.jsonl"
+# Pre-JSONL history (one JSON array); migrated on first load
+LEGACY_FEEDBACK_FILE = FEEDBACK_DIR / "feedback_history.json"
 
 # Valid feedback preset types
 VALID_FEEDBACK_TYPES = [
@@ -40,25 +57,261 @@ def _ensure_feedback_dir():
     FEEDBACK_DIR.mkdir(parents=True, exist_ok=True)
 
 
-def _load_feedback_history() -> List[Dict[str, Any]]:
-    """Load feedback history from disk."""
+# In-memory copy of the history file, refreshed only when the file changes
+# on disk (size/mtime), plus running counts for get_feedback_stats()
+_history: Optional[List[Dict[str, Any]]] = None
+_history_stamp: Optional[tuple] = None
+_by_type: Counter = Counter()
+_by_domain: Counter = Counter()
+_by_era: Counter = Counter()
+_history_lock = threading.Lock()
+_storage_ready = False
+
+# store_feedback() hands entries to a single writer thread, which collects up
+# to WRITE_BATCH_MAX of them (waiting at most WRITE_BATCH_WINDOW_SEC after the
+# first) and appends them in one write. Entries that fail to write stay in
+# _pending_* and are retried with the next batch.
+WRITE_QUEUE_MAX = 1024
+WRITE_BATCH_MAX = 256
+WRITE_BATCH_WINDOW_SEC = 0.2
+SHUTDOWN_TIMEOUT_SEC = 2.0
+_write_queue: "queue.Queue[Any]" = queue.Queue(maxsize=WRITE_QUEUE_MAX)
+_writer: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+_STOP = object()
+_pending_entries: List[Dict[str, Any]] = []
+_pending_lines: List[bytes] = []
+
+
+def _json_line(entry: Dict[str, Any]) -> bytes:
+    """Encode one history entry as a compact JSONL line."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _json_loads(data: bytes) -> Any:
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _file_stamp() -> Optional[tuple]:
     try:
+        st = os.stat(FEEDBACK_FILE)
+    except FileNotFoundError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+def _count_entry(entry: Dict[str, Any]):
+    _by_type[entry.get("feedback_type", "unknown")] += 1
+    _by_domain[entry.get("domain", "unknown")] += 1
+    _by_era[entry.get("era", "unknown")] += 1
+
+
+def _migrate_legacy_history():
+    """Convert a feedback_history.json array into JSONL (once)."""
+    if FEEDBACK_FILE.exists() or not LEGACY_FEEDBACK_FILE.exists():
+        return
+    data = _json_loads(LEGACY_FEEDBACK_FILE.read_bytes())
+    _save_feedback_history(data if isinstance(data, list) else [])
+    logger.info(f"Migrated feedback history to {FEEDBACK_FILE.name}")
+
+
+def _prepare_storage_locked():
+    """Create the feedback dir and migrate legacy history, once. Call with _history_lock held."""
+    global _storage_ready
+    if not _storage_ready:
         _ensure_feedback_dir()
-        if FEEDBACK_FILE.exists():
-            with open(FEEDBACK_FILE, 'r') as f:
-                data = json.load(f)
-                return data if isinstance(data, list) else []
+        _migrate_legacy_history()
+        _storage_ready = True
+
+
+def _load_history_locked() -> List[Dict[str, Any]]:
+    """Return the cached history, re-reading the file only if it changed. Call with _history_lock held."""
+    global _history, _history_stamp
+    _prepare_storage_locked()
+    stamp = _file_stamp()
+    if _history is not None and stamp == _history_stamp:
+        return _history
+    
+    history = []
+    if stamp is not None:
+        with open(FEEDBACK_FILE, 'rb') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = _json_loads(line)
+                except ValueError:
+                    logger.warning("Skipping malformed feedback line")
+                    continue
+                if isinstance(entry, dict):
+                    history.append(entry)
+    # Entries still waiting to be flushed are not in the file yet
+    history.extend(_pending_entries)
+    
+    _by_type.clear()
+    _by_domain.clear()
+    _by_era.clear()
+    for entry in history:
+        _count_entry(entry)
+    _history = history
+    _history_stamp = stamp
+    return history
+
+
+def _load_feedback_history() -> List[Dict[str, Any]]:
+    """Load feedback history (cached; treat the returned list as read-only)."""
+    try:
+        with _history_lock:
+            return _load_history_locked()
     except Exception as e:
         logger.error(f"Failed to load feedback history: {e}")
     return []
 
 
+def _flush_locked():
+    """Append buffered entries to the history file. Call with _history_lock held."""
+    global _history_stamp
+    if not _pending_lines:
+        return
+    try:
+        _prepare_storage_locked()
+        in_sync = _history is not None and _file_stamp() == _history_stamp
+        with open(FEEDBACK_FILE, 'ab') as f:
+            f.write(b"".join(_pending_lines))
+        logger.debug(f"Flushed {len(_pending_lines)} feedback entries")
+        _pending_lines.clear()
+        _pending_entries.clear()
+        if in_sync:
+            _history_stamp = _file_stamp()
+    except Exception as e:
+        # Keep the entries buffered; the next batch retries them
+        logger.error(f"Failed to flush feedback history: {e}")
+
+
+def _record_batch(batch: List[Dict[str, Any]]):
+    """Add entries to the in-memory history and append them to disk."""
+    with _history_lock:
+        try:
+            history = _load_history_locked()
+        except Exception as e:
+            logger.error(f"Failed to load feedback history: {e}")
+            history = None
+        for entry in batch:
+            if history is not None:
+                history.append(entry)
+                _count_entry(entry)
+            _pending_entries.append(entry)
+            _pending_lines.append(_json_line(entry))
+        _flush_locked()
+
+
+def _run_writer():
+    """
+    Drain the write queue in batches until _STOP is received.
+    
+    A threading.Event on the queue (from flush_feedback) ends the current
+    batch early and is set once everything queued before it is written.
+    """
+    while True:
+        batch = []
+        waiters = []
+        stop = False
+        item = _write_queue.get()
+        deadline = time.monotonic() + WRITE_BATCH_WINDOW_SEC
+        while True:
+            if item is _STOP:
+                stop = True
+            elif isinstance(item, threading.Event):
+                waiters.append(item)
+            else:
+                batch.append(item)
+            if stop or waiters or len(batch) >= WRITE_BATCH_MAX:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = _write_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+        try:
+            _record_batch(batch)
+        except Exception as e:
+            logger.error(f"Feedback writer failed: {e}")
+        for waiter in waiters:
+            waiter.set()
+        if stop:
+            return
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is not None:
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_run_writer, name="feedback-writer", daemon=True)
+            _writer.start()
+
+
+def flush_feedback(timeout: float = SHUTDOWN_TIMEOUT_SEC):
+    """
+    Synchronously write everything queued so far, including a batch the
+    writer thread is still collecting.
+    
+    Args:
+        timeout: Seconds to wait for the writer thread before writing here
+    """
+    writer = _writer
+    if writer is not None and writer.is_alive():
+        done = threading.Event()
+        try:
+            _write_queue.put(done, timeout=timeout)
+            if done.wait(timeout):
+                return
+        except queue.Full:
+            pass
+        logger.warning("Feedback writer did not respond, flushing queue directly")
+    
+    # No running writer: drain whatever is left on this thread
+    batch = []
+    while True:
+        try:
+            item = _write_queue.get_nowait()
+        except queue.Empty:
+            break
+        if isinstance(item, threading.Event):
+            item.set()
+        elif item is not _STOP:
+            batch.append(item)
+    _record_batch(batch)
+
+
+def _shutdown_writer():
+    """Let the writer finish its current batch, then flush the rest."""
+    writer = _writer
+    if writer is not None and writer.is_alive():
+        try:
+            _write_queue.put(_STOP, timeout=SHUTDOWN_TIMEOUT_SEC)
+            writer.join(SHUTDOWN_TIMEOUT_SEC)
+        except queue.Full:
+            pass
+    flush_feedback()
+
+
+atexit.register(_shutdown_writer)
+
+
 def _save_feedback_history(history: List[Dict[str, Any]]):
-    """Save feedback history to disk."""
+    """Rewrite the whole history file (migration only; new entries are appended)."""
     try:
         _ensure_feedback_dir()
-        with open(FEEDBACK_FILE, 'w') as f:
-            json.dump(history, f, indent=2)
+        FEEDBACK_FILE.write_bytes(b"".join(_json_line(entry) for entry in history))
         logger.debug(f"Saved {len(history)} feedback entries")
     except Exception as e:
         logger.error(f"Failed to save feedback history: {e}")
@@ -119,7 +372,7 @@ def store_feedback(
     cache_key: str = ""
 ) -> bool:
     """
-    Store feedback for a domain/era combination.
+    Queue feedback for a domain/era combination; returns without touching disk.
     
     Args:
         domain: Website domain
@@ -129,12 +382,9 @@ def store_feedback(
         cache_key: Optional cache key used for generation
     
     Returns:
-        True if stored successfully, False otherwise
+        True if queued for the writer thread, False otherwise
     """
     try:
-        _ensure_feedback_dir()
-        history = _load_feedback_history()
-        
         # Create feedback entry
         entry = {
             "timestamp": datetime.utcnow().isoformat() + "Z",
@@ -146,10 +396,14 @@ def store_feedback(
             "cache_key": cache_key[:32] if cache_key else ""
         }
         
-        history.append(entry)
-        _save_feedback_history(history)
+        _ensure_writer()
+        try:
+            _write_queue.put_nowait(entry)
+        except queue.Full:
+            logger.warning(f"Feedback write queue full, dropping feedback for {domain}")
+            return False
         
-        logger.info(f"Stored feedback for {domain} ({era}): {feedback.get('type', 'other')}")
+        logger.info(f"Queued feedback for {domain} ({era}): {feedback.get('type', 'other')}")
         return True
     
     except Exception as e:
@@ -194,38 +448,18 @@ def get_feedback_stats() -> Dict[str, Any]:
         Dict with feedback counts by type, domain, era
     """
     try:
-        history = _load_feedback_history()
-        
-        stats = {
-            "total_feedback": len(history),
-            "by_type": {},
-            "by_domain": {},
-            "by_era": {},
-            "recent_domains": []
-        }
-        
-        domains_set = set()
-        
-        for entry in history:
-            # Count by type
-            fb_type = entry.get("feedback_type", "unknown")
-            stats["by_type"][fb_type] = stats["by_type"].get(fb_type, 0) + 1
-            
-            # Count by domain
-            domain = entry.get("domain", "unknown")
-            stats["by_domain"][domain] = stats["by_domain"].get(domain, 0) + 1
-            domains_set.add(domain)
-            
-            # Count by era
-            era = entry.get("era", "unknown")
-            stats["by_era"][era] = stats["by_era"].get(era, 0) + 1
+        with _history_lock:
+            history = _load_history_locked()
+            stats = {
+                "total_feedback": len(history),
+                "by_type": dict(_by_type),
+                "by_domain": dict(_by_domain),
+                "by_era": dict(_by_era),
+                "recent_domains": []
+            }
         
         # Get recent domains
-        recent = sorted(
-            [(d, c) for d, c in stats["by_domain"].items()],
-            key=lambda x: x[1],
-            reverse=True
-        )[:10]
+        recent = heapq.nlargest(10, stats["by_domain"].items(), key=lambda x: x[1])
         stats["recent_domains"] = [{"domain": d, "count": c} for d, c in recent]
         
         return stats
@@ -1,47 +1,241 @@
+import concurrent.futures
+import functools
 import hashlib
+import http.cookiejar
 import logging
+import threading
+from collections import Counter, OrderedDict
+from operator import attrgetter, methodcaller
+from typing import Dict, List, Optional, Tuple
+
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 
+# Parse with lxml directly (no per-node Python wrappers); BeautifulSoup's
+# html.parser backend is only used if lxml is not installed
+try:
+    from lxml import etree
+    LXML_AVAILABLE = True
+except ImportError:
+    from bs4 import BeautifulSoup, Tag
+    LXML_AVAILABLE = False
+    logger.warning("lxml not available, falling back to BeautifulSoup html.parser")
+
 DEFAULT_UA = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) "
     "Gecko/20100101 Firefox/109.0"
 )
+ACCEPT_HTML = "text/html,application/xhtml+xml;q=0.9,*/*;q=0.1"
+# Anything else is rejected before the body is downloaded ("" = not declared)
+HTML_CONTENT_TYPES = frozenset({"text/html", "application/xhtml+xml", ""})
+# Bodies declared at or below this size are read in one call, not streamed
+SMALL_PAGE_BYTES = 64 * 1024
+
+
+# Keep-alive connections are reused across fetches through shared sessions,
+# one per max_redirects setting (a Session attribute, not a per-request one).
+# Their cookie jars accept nothing, so cookies set by one proxied page never
+# reach later fetches; cookies within one redirect chain still apply.
+POOL_CONNECTIONS = 32
+POOL_MAXSIZE = 64
+_sessions: Dict[int, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+# Last ETag/Last-Modified and result per URL, so revisits can send a
+# conditional GET and reuse the result on 304 Not Modified
+VALIDATOR_CACHE_MAX = 10000
+_validator_cache: "OrderedDict[str, Tuple[Optional[str], Optional[str], Dict]]" = OrderedDict()
+_validator_cache_lock = threading.Lock()
 
 
 class FetchError(Exception):
     pass
 
 
-def _compute_digest(soup: BeautifulSoup) -> str:
-    # Improved digest: tag hierarchy, counts, and text nodes
-    tag_counts = {}
+def _get_session(max_redirects: int) -> requests.Session:
+    session = _sessions.get(max_redirects)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(max_redirects)
+            if session is None:
+                session = requests.Session()
+                session.max_redirects = max_redirects
+                session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+                session.headers["User-Agent"] = DEFAULT_UA
+                session.headers["Accept"] = ACCEPT_HTML
+                adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _sessions[max_redirects] = session
+    return session
+
+
+def _validator_get(url: str) -> Optional[Tuple[Optional[str], Optional[str], Dict]]:
+    with _validator_cache_lock:
+        entry = _validator_cache.get(url)
+        if entry is not None:
+            _validator_cache.move_to_end(url)
+        return entry
+
+
+def _validator_put(url: str, etag: Optional[str], last_modified: Optional[str], result: Dict) -> None:
+    with _validator_cache_lock:
+        _validator_cache[url] = (etag, last_modified, result)
+        _validator_cache.move_to_end(url)
+        if len(_validator_cache) > VALIDATOR_CACHE_MAX:
+            _validator_cache.popitem(last=False)
+
+
+# (title, meta description, tag counts, text nodes, parent/child tag shingles)
+PageInfo = Tuple[str, str, Counter, int, Counter]
+
+# Two layouts whose simhashes differ in at most this many bits are treated
+# as near-duplicates
+NEAR_DUPLICATE_BITS = 3
+
+_local = threading.local()
+_get_tag = attrgetter("tag")
+_get_parent = methodcaller("getparent")
+
+
+def _get_parser():
+    parser = getattr(_local, "parser", None)
+    if parser is None:
+        parser = _local.parser = etree.HTMLParser(recover=True, encoding="utf-8")
+    return parser
+
+
+def _element_string(el) -> Optional[str]:
+    # Same rule as BeautifulSoup's Tag.string: the text of an element whose
+    # only content is a single text node, or a single child with that property
+    while True:
+        if len(el) == 0:
+            return el.text
+        if len(el) > 1 or el.text:
+            return None
+        child = el[0]
+        if child.tail:
+            return None
+        el = child
+
+
+def _extract_lxml(html: str) -> PageInfo:
+    """Return PageInfo for an HTML document using lxml."""
+    root = None
+    if html.strip():
+        try:
+            root = etree.fromstring(html.encode("utf-8", "replace"), _get_parser())
+        except etree.XMLSyntaxError:
+            pass
+    if root is None:
+        return "", "", Counter(), 0, Counter()
+
+    title = ""
+    title_el = root.find(".//title")
+    if title_el is not None:
+        title = (_element_string(title_el) or "").strip()
+    meta_desc = ""
+    md = root.find('.//meta[@name="description"]')
+    if md is not None and md.get("content"):
+        meta_desc = md.get("content").strip()
+
+    # Counter(iterable) tallies in C; only the text-node check stays in Python.
+    # Tag names are read once and reused for the (parent, child) shingles.
+    elements = list(root.iter(etree.Element))
+    tags = list(map(_get_tag, elements))
+    tag_counts = Counter(tags)
     text_nodes = 0
-    for tag in soup.find_all():
-        tag_counts[tag.name] = tag_counts.get(tag.name, 0) + 1
-        if tag.string and tag.string.strip():
+    for string in map(_element_string, elements):
+        if string and string.strip():
             text_nodes += 1
-    
-    tag_items = [f"{k}:{tag_counts[k]}" for k in sorted(tag_counts.keys())]
+    children = elements[1:]
+    shingles = Counter(zip(map(_get_tag, map(_get_parent, children)), tags[1:]))
+    shingles[("", tags[0])] += 1
+    return title, meta_desc, tag_counts, text_nodes, shingles
+
+
+def _extract_bs4(html: str) -> PageInfo:
+    """Return PageInfo for an HTML document using BeautifulSoup."""
+    soup = BeautifulSoup(html, "html.parser")
     title = soup.title.string.strip() if soup.title and soup.title.string else ""
+    meta_desc = ""
+    md = soup.find("meta", attrs={"name": "description"})
+    if md and md.get("content"):
+        meta_desc = md.get("content").strip()
+
+    tag_counts = Counter()
+    shingles = Counter()
+    text_nodes = 0
+    for el in soup.descendants:
+        if isinstance(el, Tag):
+            tag_counts[el.name] += 1
+            parent = el.parent
+            shingles[(parent.name if parent is not soup else "", el.name)] += 1
+            string = el.string
+            if string and string.strip():
+                text_nodes += 1
+    return title, meta_desc, tag_counts, text_nodes, shingles
+
+
+@functools.lru_cache(maxsize=4096)
+def _shingle_hash(parent: str, tag: str) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{parent}/{tag}".encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _compute_simhash(shingles: Counter) -> str:
+    """64-bit simhash over parent/child tag shingles, weighted by occurrence."""
+    weights = [0] * 64
+    for (parent, tag), count in shingles.items():
+        h = _shingle_hash(parent, tag)
+        for bit in range(64):
+            if h >> bit & 1:
+                weights[bit] += count
+            else:
+                weights[bit] -= count
+    value = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            value |= 1 << bit
+    return f"{value:016x}"
+
+
+def simhash_hamming(a: str, b: str) -> int:
+    """Number of differing bits between two simhash hex strings."""
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def _compute_digest_from_counts(tag_counts: Counter, title: str, text_nodes: int) -> str:
+    # Improved digest: tag hierarchy, counts, and text nodes
+    tag_items = "|".join([f"{k}:{tag_counts[k]}" for k in sorted(tag_counts.keys())])
     
     # Include hierarchy info: count of divs, forms, inputs to detect layout changes
     div_count = tag_counts.get("div", 0)
     form_count = tag_counts.get("form", 0)
     input_count = tag_counts.get("input", 0)
+    extra = f"|title:{title}|divs:{div_count}|forms:{form_count}|inputs:{input_count}|text_nodes:{text_nodes}"
     
-    data = ("|".join(tag_items) + f"|title:{title}|divs:{div_count}|forms:{form_count}|inputs:{input_count}|text_nodes:{text_nodes}")
-    logger.debug(f"Computed digest for {title}: {data[:100]}...")
-    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+    # Hash the two parts incrementally rather than building one combined string.
+    # A fingerprint, not a security boundary: 128-bit blake2b like reduce_dom
+    h = hashlib.blake2b(digest_size=16)
+    h.update(tag_items.encode("utf-8"))
+    h.update(extra.encode("utf-8"))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Computed digest for {title}: {(tag_items + extra)[:100]}...")
+    return h.hexdigest()
 
 
 def fetch_page(url: str, timeout: int = 10, max_size: int = 5 * 1024 * 1024, max_redirects: int = 5):
     logger.info(f"Fetching page: {url}")
-    session = requests.Session()
-    session.max_redirects = max_redirects
-    headers = {"User-Agent": DEFAULT_UA}
+    session = _get_session(max_redirects)
+    headers = {}
+    cached = _validator_get(url)
+    if cached is not None:
+        if cached[0]:
+            headers["If-None-Match"] = cached[0]
+        if cached[1]:
+            headers["If-Modified-Since"] = cached[1]
 
     try:
         # Stream so we can bail out if the response is too large
@@ -49,6 +243,18 @@ def fetch_page(url: str, timeout: int = 10, max_size: int = 5 * 1024 * 1024, max
             resp.raise_for_status()
             logger.info(f"Fetched {url} -> {resp.status_code} from {resp.url}")
 
+            if resp.status_code == 304 and cached is not None:
+                logger.info(f"{url} not modified, reusing previous result")
+                return dict(cached[2])
+            etag = resp.headers.get("ETag")
+            last_modified = resp.headers.get("Last-Modified")
+
+            content_type = resp.headers.get("Content-Type", "").split(";", 1)[0].strip().lower()
+            if content_type not in HTML_CONTENT_TYPES:
+                logger.warning(f"Unsupported content type for {url}: {content_type}")
+                return {"error": "unsupported_content_type", "content_type": content_type}
+
+            cl = None
             content_length = resp.headers.get("Content-Length")
             if content_length is not None:
                 try:
@@ -59,18 +265,32 @@ def fetch_page(url: str, timeout: int = 10, max_size: int = 5 * 1024 * 1024, max
                 except ValueError:
                     pass
 
-            chunks = []
-            size = 0
-            for chunk in resp.iter_content(chunk_size=8192):
-                if not chunk:
-                    break
-                size += len(chunk)
-                if size > max_size:
-                    logger.warning(f"Downloaded content exceeds {max_size}: {size} bytes")
-                    return {"error": "content_too_large", "downloaded": size}
-                chunks.append(chunk)
+            # With a Content-Encoding, Content-Length is the compressed size and
+            # says nothing about what it inflates to, so only the bounded loop
+            # below may decode it
+            encoded = resp.headers.get("Content-Encoding", "identity").lower() != "identity"
+            if cl is not None and 0 <= cl <= SMALL_PAGE_BYTES and not encoded:
+                buf = resp.content
+                if len(buf) > max_size:
+                    logger.warning(f"Downloaded content exceeds {max_size}: {len(buf)} bytes")
+                    return {"error": "content_too_large", "downloaded": len(buf)}
+            else:
+                # Copy chunks into one buffer, sized up front when the length is
+                # known; slice assignment past the end grows it otherwise
+                buf = bytearray(cl if cl is not None and cl >= 0 else 0)
+                size = 0
+                for chunk in resp.iter_content(chunk_size=65536):
+                    if not chunk:
+                        break
+                    end = size + len(chunk)
+                    if end > max_size:
+                        logger.warning(f"Downloaded content exceeds {max_size}: {end} bytes")
+                        return {"error": "content_too_large", "downloaded": end}
+                    buf[size:end] = chunk
+                    size = end
+                del buf[size:]
 
-            html = b"".join(chunks).decode(resp.encoding or "utf-8", errors="replace")
+            html = buf.decode(resp.encoding or "utf-8", errors="replace")
 
     except requests.exceptions.Timeout:
         logger.error(f"Timeout fetching {url} after {timeout}s")
@@ -81,20 +301,14 @@ def fetch_page(url: str, timeout: int = 10, max_size: int = 5 * 1024 * 1024, max
 
     # Parse DOM (static, no JS execution)
     logger.debug(f"Parsing DOM for {url}")
-    soup = BeautifulSoup(html, "lxml")
+    extract = _extract_lxml if LXML_AVAILABLE else _extract_bs4
+    title, meta_desc, tag_counts, text_nodes, shingles = extract(html)
+    tag_count = sum(tag_counts.values())
+    div_count = tag_counts["div"]
 
-    # Gather basic metadata
-    title = soup.title.string.strip() if soup.title and soup.title.string else ""
-    meta_desc = ""
-    md = soup.find("meta", attrs={"name": "description"})
-    if md and md.get("content"):
-        meta_desc = md.get("content").strip()
-
-    tag_count = len(soup.find_all())
-    div_count = len(soup.find_all("div"))
-
-    digest = _compute_digest(soup)
-    logger.info(f"Digest for {url}: {digest}")
+    digest = _compute_digest_from_counts(tag_counts, title, text_nodes)
+    simhash = _compute_simhash(shingles)
+    logger.info(f"Digest for {url}: {digest} (simhash {simhash})")
 
     result = {
         "status": "ok",
@@ -106,6 +320,43 @@ def fetch_page(url: str, timeout: int = 10, max_size: int = 5 * 1024 * 1024, max
         "tag_count": tag_count,
         "div_count": div_count,
         "digest": digest,
+        "simhash": simhash,
     }
+    if etag or last_modified:
+        _validator_put(url, etag, last_modified, dict(result))
     logger.info(f"Fetch result for {url}: {result['status']} ({result['tag_count']} tags)")
     return result
+
+
+def fetch_pages(urls: List[str], max_workers: int = 16, **kwargs) -> List[Dict]:
+    """
+    Fetch several pages concurrently with fetch_page().
+    
+    Network waits and lxml parsing release the GIL, so a thread pool overlaps
+    them across URLs; pooled sessions keep connections alive between tasks.
+    
+    Args:
+        urls: Pages to fetch
+        max_workers: Upper bound on concurrent fetches
+        **kwargs: Passed through to fetch_page() (timeout, max_size, ...)
+    
+    Returns:
+        One result per URL, in input order; a failed fetch becomes an
+        {"status": "error", "error": "fetch_failed", ...} entry, so one bad
+        URL does not discard the others
+    """
+    if not urls:
+        return []
+    
+    def fetch_one(url: str) -> Dict:
+        try:
+            return fetch_page(url, **kwargs)
+        except FetchError as e:
+            return {"status": "error", "error": "fetch_failed", "message": str(e), "url": url}
+        except Exception as e:
+            logger.exception(f"Unexpected error fetching {url}: {e}")
+            return {"status": "error", "error": "fetch_failed", "message": str(e), "url": url}
+    
+    workers = max(1, min(max_workers, len(urls)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetch") as pool:
+        return list(pool.map(fetch_one, urls))
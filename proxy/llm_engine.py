@@ -10,19 +10,22 @@ Handles:
 - Token output parsing
 """
 
+import functools
 import logging
+import shutil
+import subprocess
 import threading
 import time
 import psutil
 import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterator, List, Tuple
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
 # Try importing llama-cpp-python; if not available, use mock
 try:
-    from llama_cpp import Llama
+    from llama_cpp import Llama, StoppingCriteriaList
     LLAMA_CPP_AVAILABLE = True
 except ImportError:
     LLAMA_CPP_AVAILABLE = False
@@ -34,42 +37,273 @@ MODEL_REPO = "TheBloke/Mistral-7B-Instruct-v0.1-GGUF"
 MODEL_FILENAME = "mistral-7b-instruct-v0.1.Q4_K_M.gguf"
 MODEL_CACHE_DIR = Path.home() / ".cache" / "retros_models"
 
+# Quantizations picked by _pick_quant(); LLAMA_MODEL_QUANT forces one.
+# Q5_K_S is better quality at similar speed when it fits in VRAM; Q8_0 skips
+# the dequant step and is faster per token on AMX CPUs.
+MODEL_FILES = {
+    "Q4_K_M": MODEL_FILENAME,
+    "Q5_K_S": "mistral-7b-instruct-v0.1.Q5_K_S.gguf",
+    "Q8_0": "mistral-7b-instruct-v0.1.Q8_0.gguf",
+}
+# RSS ceiling per quantization (~5.5GB resident for Q4 on CPU)
+MODEL_MEMORY_LIMIT_MB = {"Q4_K_M": 6000, "Q5_K_S": 6500, "Q8_0": 9000}
+MIN_GPU_FREE_MB_Q5 = 12288
+# ggml_type value for bf16 (ggml.h); llama-cpp-python does not export it
+GGML_TYPE_BF16 = 30
+
 # Inference config
 MAX_TOKENS = 1500
 TEMPERATURE = 0.3
 TOP_P = 0.95
 TOP_K = 40
+STOP_SEQUENCES = ["---", "\n\n\n"]
+
+# CPU threading: generation is memory-bound and scales to about half the
+# logical cores; prompt prefill (batch) can use all of them
+_CPU_COUNT = os.cpu_count() or 2
+N_THREADS = max(1, _CPU_COUNT // 2)
+N_THREADS_BATCH = _CPU_COUNT
+# Lock the mmap'd weights in RAM so they are not paged out between requests
+# (needs a large enough RLIMIT_MEMLOCK; loading retries without it)
+USE_MLOCK = True
+
+# Prompt prefix reuse: KV states of recent prompts are kept in a llama.cpp RAM
+# cache keyed by tokens, and a new prompt restores the state with the longest
+# shared prefix. Prompts from css_token_format start with an era-only template
+# (get_era_prompt_parts), so only the page-specific suffix is prefilled on a
+# hit. The capacity is sized at load for PROMPT_CACHE_ENTRIES full-context
+# states (_prompt_cache_bytes) and added to the memory ceiling in _check_memory.
+PROMPT_CACHE_ENTRIES = 4
+
+# Speculative decoding (RETROS_SPECULATIVE=1): draft tokens are proposed by
+# n-gram lookup over the prompt and context and verified by the main model
+# in one batch. CSS token output mostly repeats property names and values
+# already present in the era template, so acceptance is high. Off by default
+# because llama.cpp then keeps logits for every position (more memory).
+SPECULATIVE = os.environ.get("RETROS_SPECULATIVE") == "1"
+SPECULATIVE_DRAFT_TOKENS = 10
+
+# GPU offload: all layers (-1) when a GPU with enough free VRAM is found,
+# PARTIAL_GPU_LAYERS if full offload fails to load. LLAMA_N_GPU_LAYERS
+# overrides detection. Needs a GPU build of llama-cpp-python, e.g.
+#   CMAKE_ARGS="-DLLAMA_CUBLAS=on" pip install llama-cpp-python
+MIN_GPU_FREE_MB = 6144
+PARTIAL_GPU_LAYERS = 20
 
-# Global model instance (lazy-loaded)
+# Realistic token output returned when llama-cpp-python is not installed
+MOCK_TOKEN_OUTPUT = """RULE body
+  PROPERTY: BACKGROUND #C0C0C0
+  PROPERTY: COLOR #000000
+  PROPERTY: FONT_FAMILY Arial
+
+RULE h1, h2, h3
+  PROPERTY: COLOR #000080
+  PROPERTY: FONT_WEIGHT bold
+
+RULE a
+  PROPERTY: COLOR #0000FF
+  PROPERTY: TEXT_DECORATION underline
+
+RULE button
+  PROPERTY: BACKGROUND #C0C0C0
+  PROPERTY: BORDER 2px solid
+  PROPERTY: PADDING 4px 12px"""
+
+# Global model instance (lazy-loaded) and the quantization it was loaded with
 _model_instance = None
+_model_quant = "Q4_K_M"
 _model_lock = threading.Lock()
+# RAM reserved for the prompt cache (0 until one is attached)
+_prompt_cache_mb = 0.0
+
+
+@functools.lru_cache(maxsize=1)
+def _cpu_flags() -> frozenset:
+    """CPU feature flags from /proc/cpuinfo (empty where unavailable)."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    return frozenset(line.split(":", 1)[1].split())
+    except OSError:
+        pass
+    return frozenset()
+
+
+def _gpu_free_mb() -> Optional[int]:
+    """Free VRAM on the largest NVIDIA GPU, or None if it cannot be queried."""
+    if not shutil.which("nvidia-smi"):
+        return None
+    try:
+        out = subprocess.run(
+            ["nvidia-smi", "--query-gpu=memory.free", "--format=csv,noheader,nounits"],
+            capture_output=True, text=True, timeout=5, check=True,
+        ).stdout
+        return max(int(line) for line in out.split() if line.strip().isdigit())
+    except Exception as e:
+        logger.warning(f"nvidia-smi query failed: {e}")
+        return None
 
 
 def _detect_gpu() -> bool:
-    """Detect if CUDA/ROCm is available."""
+    """Detect if llama.cpp can offload to a GPU with enough free memory."""
     try:
         import llama_cpp
-        # Check for CUDA support in llama-cpp-python
-        # If compiled with CUDA, it will have gpu_layers support
-        return True  # Will be properly detected at initialization
     except ImportError:
         return False
+    
+    supports_offload = getattr(llama_cpp, "llama_supports_gpu_offload", None)
+    if supports_offload is not None:
+        try:
+            if not supports_offload():
+                return False
+        except Exception as e:
+            logger.debug(f"GPU offload check failed: {e}")
+            return False
+    
+    # On NVIDIA, also require enough free VRAM for the whole model
+    if shutil.which("nvidia-smi"):
+        free_mb = _gpu_free_mb()
+        logger.info(f"GPU free memory: {free_mb}MB")
+        return free_mb is not None and free_mb >= MIN_GPU_FREE_MB
+    
+    # Non-NVIDIA offload (Metal, ROCm): trust the build flag
+    return supports_offload is not None
 
 
-def _get_or_download_model() -> str:
+def _gpu_layers(use_gpu: bool) -> int:
+    """Layers to offload: LLAMA_N_GPU_LAYERS if set, else all or none."""
+    override = os.environ.get("LLAMA_N_GPU_LAYERS")
+    if override:
+        try:
+            return int(override)
+        except ValueError:
+            logger.warning(f"Ignoring invalid LLAMA_N_GPU_LAYERS={override!r}")
+    return -1 if use_gpu else 0
+
+
+def _pick_quant(use_gpu: bool) -> str:
+    """Choose a quantization for this machine (see MODEL_FILES)."""
+    override = os.environ.get("LLAMA_MODEL_QUANT")
+    if override:
+        if override in MODEL_FILES:
+            return override
+        logger.warning(f"Ignoring unknown LLAMA_MODEL_QUANT={override!r}")
+    
+    if use_gpu:
+        free_mb = _gpu_free_mb()
+        if free_mb is not None and free_mb >= MIN_GPU_FREE_MB_Q5:
+            return "Q5_K_S"
+    elif "amx_int8" in _cpu_flags():
+        return "Q8_0"
+    return "Q4_K_M"
+
+
+def _kv_cache_kwargs(use_gpu: bool) -> Dict[str, Any]:
+    """BF16 KV cache on CPUs with native bf16 (halves KV bandwidth vs F16)."""
+    if use_gpu or not ({"avx512_bf16", "amx_bf16"} & _cpu_flags()):
+        return {}
+    # llama.cpp only accepts a non-F16 V cache with flash attention
+    return {"type_k": GGML_TYPE_BF16, "type_v": GGML_TYPE_BF16, "flash_attn": True}
+
+
+# Optional load settings. A group is dropped right away if this llama-cpp-python
+# build rejects one of its arguments; otherwise all of them are dropped together
+# only as the last load fallback in _init_model (after the GPU-layers one).
+_OPTIONAL_LOAD_SETTINGS = (
+    ("mlock", ("use_mlock",)),
+    ("bf16 KV cache", ("type_k", "type_v", "flash_attn")),
+    ("speculative decoding", ("draft_model",)),
+)
+
+
+def _prompt_cache_bytes(model: Any) -> Tuple[int, int]:
+    """
+    Size the prompt cache for PROMPT_CACHE_ENTRIES saved states at full context.
+    
+    LlamaRAMCache evicts until the summed llama_state_size fits its capacity,
+    so a capacity below one state drops every entry as soon as it is stored.
+    A state is the fixed part measured with save_state() plus the KV cells
+    (f16/bf16 K and V per layer) for n_ctx tokens, plus one batch of logits
+    when llama.cpp keeps logits for every position (speculative decoding).
+    
+    Args:
+        model: Loaded Llama instance
+    
+    Returns:
+        (capacity in bytes for LlamaRAMCache, total RAM to reserve including
+        the scores array each saved state copies on the Python side)
+    """
+    metadata = model.metadata
+    arch = metadata.get("general.architecture", "llama")
+    n_layer = int(metadata[f"{arch}.block_count"])
+    n_head = int(metadata[f"{arch}.attention.head_count"])
+    n_head_kv = int(metadata.get(f"{arch}.attention.head_count_kv", n_head))
+    kv_bytes_per_token = 2 * n_layer * (model.n_embd() // n_head * n_head_kv) * 2
+    
+    n_ctx = model.n_ctx()
+    row_bytes = model.n_vocab() * 4
+    logits_all = model.context_params.logits_all
+    state_bytes = model.save_state().llama_state_size + n_ctx * kv_bytes_per_token
+    if logits_all:
+        state_bytes += model.n_batch * row_bytes
+    scores_bytes = (n_ctx if logits_all else model.n_batch) * row_bytes
+    
+    capacity = PROMPT_CACHE_ENTRIES * state_bytes
+    return capacity, capacity + PROMPT_CACHE_ENTRIES * scores_bytes
+
+
+def _load_llama(model_kwargs: Dict[str, Any]) -> Any:
+    """Construct Llama, dropping optional settings this build does not accept as arguments."""
+    while True:
+        try:
+            return Llama(**model_kwargs)
+        except TypeError as e:
+            message = str(e)
+            for name, keys in _OPTIONAL_LOAD_SETTINGS:
+                if any(key in model_kwargs and f"'{key}'" in message for key in keys):
+                    break
+            else:
+                raise
+            logger.warning(f"llama-cpp-python does not support {name} ({e}), loading without it")
+            for key in keys:
+                model_kwargs.pop(key, None)
+
+
+def _load_fallbacks(model_kwargs: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any], List[str]]]:
+    """Retries for a failed load, in order: (description, settings to change, keys to drop)."""
+    fallbacks = []
+    if model_kwargs["n_gpu_layers"] == -1:
+        # Full offload did not fit; keep part of the model on the GPU
+        fallbacks.append((f"{PARTIAL_GPU_LAYERS} GPU layers", {"n_gpu_layers": PARTIAL_GPU_LAYERS}, []))
+    names = []
+    keys = []
+    for name, group in _OPTIONAL_LOAD_SETTINGS:
+        if any(model_kwargs.get(key) for key in group):
+            names.append(name)
+            keys.extend(group)
+    if keys:
+        fallbacks.append((f"no {', '.join(names)}", {}, keys))
+    return fallbacks
+
+
+def _get_or_download_model(filename: str = MODEL_FILENAME) -> str:
     """
     Download model from HuggingFace if not cached, return path.
     
+    Args:
+        filename: GGUF file in MODEL_REPO
+    
     Returns:
         Path to the GGUF model file
     """
-    model_path = MODEL_CACHE_DIR / MODEL_FILENAME
+    model_path = MODEL_CACHE_DIR / filename
     
     if model_path.exists():
         logger.info(f"Model found at {model_path}")
         return str(model_path)
     
-    logger.info(f"Downloading {MODEL_REPO}/{MODEL_FILENAME}...")
+    logger.info(f"Downloading {MODEL_REPO}/{filename}...")
     MODEL_CACHE_DIR.mkdir(parents=True, exist_ok=True)
     
     try:
@@ -77,7 +311,7 @@ def _get_or_download_model() -> str:
         
         model_path = hf_hub_download(
             repo_id=MODEL_REPO,
-            filename=MODEL_FILENAME,
+            filename=filename,
             cache_dir=str(MODEL_CACHE_DIR),
             local_dir=str(MODEL_CACHE_DIR),
         )
@@ -99,31 +333,81 @@ def _init_model(use_gpu: bool = True) -> Any:
     Returns:
         Loaded model (Llama instance from llama-cpp-python)
     """
+    global _model_quant, _prompt_cache_mb
+    
     if not LLAMA_CPP_AVAILABLE:
         logger.warning("llama-cpp-python not installed. Using mock model.")
         return None
     
-    from llama_cpp import Llama
-    
     try:
-        model_path = _get_or_download_model()
-        
-        logger.info(f"Loading model with use_gpu={use_gpu}...")
+        quant = _pick_quant(use_gpu)
+        try:
+            model_path = _get_or_download_model(MODEL_FILES[quant])
+        except Exception as e:
+            if quant == "Q4_K_M":
+                raise
+            logger.warning(f"{quant} model unavailable ({e}), falling back to Q4_K_M")
+            quant = "Q4_K_M"
+            model_path = _get_or_download_model(MODEL_FILES[quant])
         
-        # Determine GPU layer count - use CPU for now to manage memory
-        # Full GPU would be 40 layers but uses more RAM
-        # CPU-only (0 layers) is more memory efficient for testing
-        n_gpu_layers = 0  # Keep on CPU for now
+        n_gpu_layers = _gpu_layers(use_gpu)
+        logger.info(f"Loading {quant} model with use_gpu={use_gpu}, n_gpu_layers={n_gpu_layers}...")
         
-        model = Llama(
+        model_kwargs = dict(
             model_path=model_path,
             n_gpu_layers=n_gpu_layers,
             n_ctx=2048,  # Context window
             n_batch=512,
+            n_threads=N_THREADS,
+            n_threads_batch=N_THREADS_BATCH,
+            use_mmap=True,
+            use_mlock=USE_MLOCK,
             verbose=False,
+            **_kv_cache_kwargs(use_gpu),
         )
+        if SPECULATIVE:
+            from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+            model_kwargs["draft_model"] = LlamaPromptLookupDecoding(num_pred_tokens=SPECULATIVE_DRAFT_TOKENS)
+        fallbacks = _load_fallbacks(model_kwargs)
+        while True:
+            try:
+                model = _load_llama(model_kwargs)
+                break
+            except Exception as e:
+                if not fallbacks:
+                    raise
+                description, updates, drop = fallbacks.pop(0)
+                logger.warning(f"Model load failed ({e}), retrying with {description}")
+                model_kwargs.update(updates)
+                for key in drop:
+                    model_kwargs.pop(key, None)
         
-        logger.info("Model loaded successfully")
+        # One-token warmup so weights are paged in and compute buffers are
+        # allocated before the first real request
+        try:
+            model("warmup", max_tokens=1)
+        except Exception as e:
+            logger.warning(f"Model warmup failed: {e}")
+        
+        # Attached after warmup so the warmup prompt is not cached
+        try:
+            from llama_cpp import LlamaRAMCache
+            capacity, reserved = _prompt_cache_bytes(model)
+            model.set_cache(LlamaRAMCache(capacity_bytes=capacity))
+            _prompt_cache_mb = reserved / (1024 * 1024)
+            logger.info(
+                f"Prompt cache: {PROMPT_CACHE_ENTRIES} states, capacity {capacity / (1024 * 1024):.0f}MB, "
+                f"{_prompt_cache_mb:.0f}MB reserved"
+            )
+        except Exception as e:
+            logger.warning(f"Prompt cache unavailable: {e}")
+        
+        _model_quant = quant
+        logger.info(
+            f"Model loaded successfully ({quant}, threads={N_THREADS}/{N_THREADS_BATCH}, "
+            f"gpu_layers={model_kwargs['n_gpu_layers']}, bf16_kv={'type_k' in model_kwargs}, "
+            f"speculative={'draft_model' in model_kwargs})"
+        )
         return model
     
     except Exception as e:
@@ -158,9 +442,20 @@ def get_model() -> Any:
             raise
 
 
+_process: Optional[psutil.Process] = None
+
+
+def _get_process() -> psutil.Process:
+    """psutil handle for this process, recreated after a fork (e.g. gunicorn workers)."""
+    global _process
+    if _process is None or _process.pid != os.getpid():
+        _process = psutil.Process(os.getpid())
+    return _process
+
+
 def get_memory_usage() -> Dict[str, float]:
     """Get current memory usage stats."""
-    process = psutil.Process(os.getpid())
+    process = _get_process()
     mem_info = process.memory_info()
     
     return {
@@ -172,16 +467,23 @@ def get_memory_usage() -> Dict[str, float]:
 
 def _check_memory() -> bool:
     """Check if memory usage is acceptable."""
-    mem = get_memory_usage()
-    max_mem_mb = 6000  # Raised limit for CPU-based inference (~5.5GB for Mistral-7B Q4)
+    # RSS only; memory_percent() would also read /proc/meminfo
+    rss_mb = _get_process().memory_info().rss / (1024 * 1024)
+    # Saved prompt states live outside the model's own footprint
+    max_mem_mb = MODEL_MEMORY_LIMIT_MB[_model_quant] + _prompt_cache_mb
     
-    if mem["rss_mb"] > max_mem_mb:
-        logger.error(f"Memory limit exceeded: {mem['rss_mb']:.1f}MB > {max_mem_mb}MB")
+    if rss_mb > max_mem_mb:
+        logger.error(f"Memory limit exceeded: {rss_mb:.1f}MB > {max_mem_mb:.0f}MB")
         return False
     
     return True
 
 
+def _deadline_criteria(deadline: float) -> Any:
+    """stopping_criteria that ends generation at the first token past deadline (monotonic)."""
+    return StoppingCriteriaList([lambda input_ids, logits: time.monotonic() > deadline])
+
+
 def generate_tokens(prompt: str, max_tokens: int = MAX_TOKENS, timeout_sec: int = 5) -> str:
     """
     Generate token output from prompt using LLM.
@@ -192,10 +494,10 @@ def generate_tokens(prompt: str, max_tokens: int = MAX_TOKENS, timeout_sec: int
         timeout_sec: Timeout in seconds
     
     Returns:
-        Generated token text (or error message if timeout/failure)
+        Generated token text; generation is cut off at the first token after
+        timeout_sec, so a slow run returns partial output
     
     Raises:
-        TimeoutError: If generation exceeds timeout
         RuntimeError: If model fails or memory issues
     """
     try:
@@ -209,29 +511,14 @@ def generate_tokens(prompt: str, max_tokens: int = MAX_TOKENS, timeout_sec: int
         if model is None:
             logger.info(f"Mock mode: Generating sample tokens (no real LLM)")
             # Return realistic token output for testing
-            return """RULE body
-  PROPERTY: BACKGROUND #C0C0C0
-  PROPERTY: COLOR #000000
-  PROPERTY: FONT_FAMILY Arial
-
-RULE h1, h2, h3
-  PROPERTY: COLOR #000080
-  PROPERTY: FONT_WEIGHT bold
-
-RULE a
-  PROPERTY: COLOR #0000FF
-  PROPERTY: TEXT_DECORATION underline
-
-RULE button
-  PROPERTY: BACKGROUND #C0C0C0
-  PROPERTY: BORDER 2px solid
-  PROPERTY: PADDING 4px 12px"""
+            return MOCK_TOKEN_OUTPUT
         
         logger.info(f"Starting inference (max_tokens={max_tokens}, timeout={timeout_sec}s)")
-        mem_before = get_memory_usage()
+        track_memory = logger.isEnabledFor(logging.DEBUG)
+        mem_before = get_memory_usage() if track_memory else None
         
-        # Run inference with timeout (using a separate thread with timeout simulation)
-        start_time = time.time()
+        # The deadline is enforced per token by llama.cpp, not after the call
+        start_time = time.monotonic()
         
         completion = model(
             prompt,
@@ -239,28 +526,88 @@ RULE button
             temperature=TEMPERATURE,
             top_p=TOP_P,
             top_k=TOP_K,
-            stop=["---", "\n\n\n"],  # Stop sequences
+            stop=STOP_SEQUENCES,
+            stopping_criteria=_deadline_criteria(start_time + timeout_sec),
         )
         
-        elapsed = time.time() - start_time
-        
-        # Check timeout
+        elapsed = time.monotonic() - start_time
         if elapsed > timeout_sec:
-            logger.warning(f"Inference exceeded timeout: {elapsed:.1f}s > {timeout_sec}s")
-            raise TimeoutError(f"Generation timeout after {elapsed:.1f}s")
-        
-        mem_after = get_memory_usage()
-        mem_delta = mem_after["rss_mb"] - mem_before["rss_mb"]
+            logger.warning(f"Inference stopped at the {timeout_sec}s deadline, returning partial output")
         
         generated_text = completion["choices"][0]["text"].strip()
-        
-        logger.info(
-            f"Inference complete: {elapsed:.1f}s, {len(generated_text)} chars, "
-            f"Memory delta: {mem_delta:+.1f}MB"
-        )
+        logger.info(f"Inference complete: {elapsed:.1f}s, {len(generated_text)} chars")
+        if track_memory:
+            mem_delta = get_memory_usage()["rss_mb"] - mem_before["rss_mb"]
+            logger.debug(f"Memory delta: {mem_delta:+.1f}MB")
         
         return generated_text
     
+    except Exception as e:
+        logger.error(f"Generation error: {e}")
+        raise RuntimeError(f"Inference failed: {e}")
+
+
+def generate_tokens_stream(prompt: str, max_tokens: int = MAX_TOKENS, timeout_sec: int = 5) -> Iterator[str]:
+    """
+    Stream token output from the LLM chunk by chunk.
+    
+    Like generate_tokens(), but text is yielded as it is decoded so callers can
+    parse while generation continues. Generation stops at the first token past
+    the deadline, and an overrun is reported as TimeoutError since the caller
+    has already consumed the partial output.
+    
+    Args:
+        prompt: The prompt (from css_token_format.get_era_prompt)
+        max_tokens: Max tokens to generate
+        timeout_sec: Timeout in seconds
+    
+    Yields:
+        Chunks of generated token text
+    
+    Raises:
+        TimeoutError: If generation exceeds timeout
+        RuntimeError: If model fails or memory issues
+    """
+    try:
+        if not _check_memory():
+            raise RuntimeError("Memory usage too high")
+        
+        model = get_model()
+        
+        if model is None:
+            logger.info("Mock mode: Streaming sample tokens (no real LLM)")
+            yield from MOCK_TOKEN_OUTPUT.splitlines(keepends=True)
+            return
+        
+        logger.info(f"Starting streamed inference (max_tokens={max_tokens}, timeout={timeout_sec}s)")
+        start_time = time.monotonic()
+        deadline = start_time + timeout_sec
+        generated_chars = 0
+        
+        for chunk in model(
+            prompt,
+            max_tokens=max_tokens,
+            temperature=TEMPERATURE,
+            top_p=TOP_P,
+            top_k=TOP_K,
+            stop=STOP_SEQUENCES,
+            stopping_criteria=_deadline_criteria(deadline),
+            stream=True,
+        ):
+            text = chunk["choices"][0]["text"]
+            if text:
+                generated_chars += len(text)
+                yield text
+            if time.monotonic() > deadline:
+                break
+        
+        elapsed = time.monotonic() - start_time
+        if elapsed > timeout_sec:
+            logger.warning(f"Inference exceeded timeout: {elapsed:.1f}s > {timeout_sec}s")
+            raise TimeoutError(f"Generation timeout after {elapsed:.1f}s")
+        
+        logger.info(f"Streamed inference complete: {elapsed:.1f}s, {generated_chars} chars")
+    
     except TimeoutError:
         logger.error("Generation timeout")
         raise
@@ -289,7 +636,7 @@ def get_model_info() -> Dict[str, Any]:
             return {
                 "status": "mock_mode",
                 "model": MODEL_REPO,
-                "filename": MODEL_FILENAME,
+                "filename": MODEL_FILES[_model_quant],
                 "note": "llama-cpp-python not installed, using mock outputs",
                 "memory_rss_mb": mem["rss_mb"],
                 "memory_vms_mb": mem["vms_mb"],
@@ -299,7 +646,7 @@ def get_model_info() -> Dict[str, Any]:
         return {
             "status": "loaded",
             "model": MODEL_REPO,
-            "filename": MODEL_FILENAME,
+            "filename": MODEL_FILES[_model_quant],
             "memory_rss_mb": mem["rss_mb"],
             "memory_vms_mb": mem["vms_mb"],
             "memory_percent": mem["percent"],
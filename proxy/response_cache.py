@@ -0,0 +1,151 @@
+"""
+Response Cache: Reuse generated CSS for pages whose layout was seen before.
+
+Entries are keyed on (era, reduce_dom digest, feedback), so different HTML
+that reduces to the same layout fingerprint skips the LLM entirely. Lookups
+are served from an in-process LRU; writes go through to a SQLite file so the
+cache survives restarts.
+
+Storage: proxy/feedback/response_cache.sqlite
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_DB = Path(__file__).parent / "feedback" / "response_cache.sqlite"
+
+# Entry limits (memory and disk) and lifetime
+RESPONSE_CACHE_MAX = 4096
+RESPONSE_CACHE_TTL_SEC = 86400
+# The disk store is trimmed back to RESPONSE_CACHE_MAX every this many writes
+PRUNE_EVERY_PUTS = 256
+
+_memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+_lock = threading.Lock()
+_db: Optional[sqlite3.Connection] = None
+_db_failed = False
+_puts_since_prune = 0
+
+
+def _get_db() -> Optional[sqlite3.Connection]:
+    """Open the SQLite store on first use; None if it is unavailable. Call with _lock held."""
+    global _db, _db_failed
+    if _db is not None or _db_failed:
+        return _db
+
+    try:
+        CACHE_DB.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(CACHE_DB), check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, css TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+        _prune(db, time.time())
+        db.commit()
+        _db = db
+    except sqlite3.Error as e:
+        logger.warning("Response cache database unavailable, using memory only: %s", e)
+        _db_failed = True
+    return _db
+
+
+def response_key(era: str, digest: str, feedback: Optional[Dict[str, str]] = None) -> str:
+    """Build the cache key for an era, DOM digest and optional feedback."""
+    feedback = feedback or {}
+    raw = f"{era}|{digest}|{feedback.get('type', '')}|{feedback.get('text', '')}"
+    return hashlib.blake2b(raw.encode("utf-8", "replace"), digest_size=16).hexdigest()
+
+
+def _prune(db: sqlite3.Connection, now: float) -> None:
+    """Drop expired rows and the oldest rows beyond RESPONSE_CACHE_MAX. Call with _lock held."""
+    db.execute("DELETE FROM responses WHERE created < ?", (now - RESPONSE_CACHE_TTL_SEC,))
+    excess = db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - RESPONSE_CACHE_MAX
+    if excess > 0:
+        db.execute(
+            "DELETE FROM responses WHERE key IN "
+            "(SELECT key FROM responses ORDER BY created LIMIT ?)",
+            (excess,),
+        )
+
+
+def _remember(key: str, css: str, created: float) -> None:
+    _memory[key] = (css, created)
+    _memory.move_to_end(key)
+    if len(_memory) > RESPONSE_CACHE_MAX:
+        _memory.popitem(last=False)
+
+
+def get_response(key: str) -> Optional[str]:
+    """
+    Look up cached CSS.
+
+    Args:
+        key: Key from response_key()
+
+    Returns:
+        Cached CSS, or None on miss or expiry
+    """
+    now = time.time()
+    with _lock:
+        entry = _memory.get(key)
+        if entry is None:
+            db = _get_db()
+            if db is None:
+                return None
+            try:
+                row = db.execute("SELECT css, created FROM responses WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                logger.warning("Response cache read failed: %s", e)
+                return None
+            if row is None:
+                return None
+            entry = (row[0], row[1])
+
+        css, created = entry
+        if now - created > RESPONSE_CACHE_TTL_SEC:
+            _memory.pop(key, None)
+            return None
+        _remember(key, css, created)
+        return css
+
+
+def put_response(key: str, css: str) -> None:
+    """
+    Store generated CSS in memory and on disk.
+
+    Args:
+        key: Key from response_key()
+        css: Validated CSS to cache
+    """
+    global _puts_since_prune
+    now = time.time()
+    with _lock:
+        _remember(key, css, now)
+        db = _get_db()
+        if db is None:
+            return
+        try:
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, css, created) VALUES (?, ?, ?)",
+                (key, css, now),
+            )
+            # Keep the disk store bounded to the memory LRU's size, checking
+            # only every PRUNE_EVERY_PUTS writes rather than on each one
+            _puts_since_prune += 1
+            if _puts_since_prune >= PRUNE_EVERY_PUTS:
+                _puts_since_prune = 0
+                _prune(db, now)
+            db.commit()
+        except sqlite3.Error as e:
+            logger.warning("Response cache write failed: %s", e)